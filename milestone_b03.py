@@ -34,12 +34,70 @@ def calculate_odds_ratio(idata, var_name="effect"):
         print(f"Variable '{var_name}' not found in posterior.")
         return pd.DataFrame()  # Return empty DataFrame to signal error
 
+def calculate_contrast_odds_ratios(idata, hdi_prob=0.95):
+    """
+    Calculates odds ratios for all contrasts of the level effects in one vectorized pass:
+    every level against the mean level (exp(level_effects[k]); level_effects is centered, so the
+    intercept is the mean log odds over the levels), every pair of levels
+    (exp(level_effects[j] - level_effects[i]) for i < j) and, for B02, the scalar 'effect'.
+
+    Args:
+        idata (az.InferenceData): InferenceData object.
+        hdi_prob (float, optional): Probability of the HDI. Defaults to 0.95.
+
+    Returns:
+        pd.DataFrame: One row per contrast with the mean odds ratio, lower and upper HDI and the
+                      probability of direction (share of draws with the log odds ratio's sign).
+    """
+    level_effects = idata.posterior["level_effects"]
+    level_dim = level_effects.dims[-1]
+    levels = level_effects[level_dim].values
+    values = level_effects.transpose("chain", "draw", level_dim).values
+    first, second = np.triu_indices(len(levels), k=1)
+
+    # log odds ratios of all contrasts, shaped (chain, draw, contrast)
+    log_or = [values, values[..., second] - values[..., first]]
+    names = [f"level_effects[{level}] vs mean level" for level in levels]
+    names += [f"level_effects[{levels[j]}] vs level_effects[{levels[i]}]" for i, j in zip(first, second)]
+    if "effect" in idata.posterior:
+        log_or.append(idata.posterior["effect"].transpose("chain", "draw").values[..., None])
+        names.append("effect")
+    log_or = np.concatenate(log_or, axis=-1)
+
+    odds_ratios = xr.DataArray(np.exp(log_or), dims=("chain", "draw", "contrast"), coords={"contrast": names})
+    hdi = az.hdi(odds_ratios.to_dataset(name="odds_ratio"), hdi_prob=hdi_prob)["odds_ratio"]
+    positive = (log_or > 0).mean(axis=(0, 1))
+    return pd.DataFrame({
+        "mean": odds_ratios.mean(("chain", "draw")).values,
+        "hdi_lower": hdi.sel(hdi="lower").values,
+        "hdi_upper": hdi.sel(hdi="higher").values,
+        "prob_direction": np.maximum(positive, 1 - positive),
+    }, index=pd.Index(names, name="contrast"))
+
 import os
+import json
 import numpy as np
 import matplotlib.pyplot as plt
 import arviz as az
+from plots_b02 import PLOT_KINDS, render_plots
 
-def run_and_summarize(data, model_func, label="b02", output_dir="../results", **model_kwargs):
+def expand_p_level_summary(summary, idata):
+    """
+    Replaces the p_level rows of an az.summary table with one p[i] row per observation.
+    All observations at the same predictor level share the same draws, so their summary
+    rows are the level's row.
+    """
+    p_level_rows = [row for row in summary.index if row.startswith("p_level[")]
+    predictor = idata.constant_data["predictor"].values
+    levels = idata.posterior["p_level"]["level"].values.tolist()
+    p_rows = summary.loc[p_level_rows].iloc[[levels.index(level) for level in predictor]]
+    p_rows.index = [f"p[{i}]" for i in range(len(predictor))]
+    return pd.concat([summary.drop(index=p_level_rows), p_rows])
+
+def run_and_summarize(data, model_func, label="b02", output_dir="../results", reference_idata=None,
+                      cache_dir=None, cache_max_bytes=2 * 1024**3, refresh=False,
+                      plots=PLOT_KINDS, plot_dpi=300, plot_format="png", plot_workers=None,
+                      plot_downsample=False, **model_kwargs):
     """
     Runs the specified PyMC model function with data and optional model parameters,
     summarizes results, and saves output files including plots, summaries, and metrics.
@@ -49,6 +107,21 @@ def run_and_summarize(data, model_func, label="b02", output_dir="../results", **
         model_func (function): PyMC model function to use.
         label (str): Label to tag output files.
         output_dir (str): Directory to save outputs.
+        reference_idata (InferenceData or str, optional): NUTS posterior (or path to its .nc file).
+                                  When the model was fitted with inference="vi", the distance of the
+                                  approximation from it is saved as survey_vi_vs_nuts_{label}.csv.
+        cache_dir (str, optional): Directory of a FitCache. A fit with the same data, model code and
+                                   kwargs is loaded from it instead of resampled; the artifacts are
+                                   still rewritten. Least recently used fits are evicted beyond
+                                   cache_max_bytes.
+        refresh (bool): Invalidate the cached fit for this call and resample.
+        plots (tuple): Plots to render, any of PLOT_KINDS ("trace", "effect", "p", "ppc", "rank").
+        plot_dpi (int): Resolution of the PNG plots.
+        plot_format (str): "png", "svg" or "none" to skip plotting.
+        plot_workers (int, optional): Processes rendering the plots concurrently (default: one per
+                                      plot); 1 renders them in this process (see render_plots).
+        plot_downsample (bool): Draw the trace and rank plots from min/max envelopes and pre-binned
+                                ranks instead of every draw, for long chains.
         **model_kwargs: Additional keyword arguments passed to model_func.
 
     Returns:
@@ -59,23 +132,46 @@ def run_and_summarize(data, model_func, label="b02", output_dir="../results", **
     """
     os.makedirs(output_dir, exist_ok=True)
 
-    #Call the model function with additional model parameters
-    model, idata, waic, loo, bic = model_func(
-        data["predictor"],
-        data["outcome"],
-        **model_kwargs  # Pass arguments like variant="B01", seed=123, etc.
-    )
+    cache, cached = None, None
+    if cache_dir is not None:
+        cache = FitCache(cache_dir, max_bytes=cache_max_bytes)
+        cache_key = fit_cache_key(data["predictor"], data["outcome"], model_func, model_kwargs)
+        if refresh:
+            cache.invalidate(cache_key)
+        cached = cache.get(cache_key)
+
+    if cached is not None:
+        print(f"ℹ️ Loaded cached fit {cache_key[:12]} for model {label.upper()}.")
+        idata, waic, loo, bic = cached
+    else:
+        #Call the model function with additional model parameters
+        model, idata, waic, loo, bic = model_func(
+            data["predictor"],
+            data["outcome"],
+            **model_kwargs  # Pass arguments like variant="B01", seed=123, etc.
+        )
+        if cache is not None:
+            cache.put(cache_key, idata, waic, loo, bic, description=label)
 
     # Save InferenceData
     idata_path = os.path.join(output_dir, f"idata_{label}.nc")
     idata.to_netcdf(idata_path)
 
+    # Save the adapted step size and mass matrix so later refits can warm-start from them
+    # (pass init_tuning=os.path.join(output_dir, f"tuning_{label}.json") with a short tune)
+    if "sample_stats" in idata and "tuning" in idata.sample_stats.attrs:
+        tuning_path = os.path.join(output_dir, f"tuning_{label}.json")
+        save_tuning(json.loads(idata.sample_stats.attrs["tuning"]), tuning_path)
+
     # Determine var_names based on model
     var_names = ["intercept", "level_effects"]
     if "effect" in idata.posterior:
         var_names += ["effect", "sd_fluctuation"]
     if "p" in idata.posterior:
         var_names.append("p")
+    elif "p_level" in idata.posterior:
+        # p stored per predictor level (p_storage="level"); summarized per level, expanded to obs below
+        var_names.append("p_level")
 
     # Remove problematic or degenerate variables
     clean_var_names = []
@@ -92,10 +188,25 @@ def run_and_summarize(data, model_func, label="b02", output_dir="../results", **
             print(f"⚠️ Skipping '{var}': not found in posterior.")
 
     # Save Summary
-    summary = az.summary(idata, var_names=clean_var_names)
+    # One diagnostics pass (summary table and sampler checks), reused by run_model_diagnostics
+    diagnostics = get_diagnostics(idata, clean_var_names)
+    save_diagnostics(diagnostics, os.path.join(output_dir, f"diagnostics_{label}.json"))
+    summary = diagnostics["summary"]
+    if "p_level" in clean_var_names:
+        summary = expand_p_level_summary(summary, idata)
     summary_path = os.path.join(output_dir, f"survey_summary_{label}.csv")
     summary.to_csv(summary_path)
 
+    # Distance of a VI/Pathfinder approximation from the NUTS posterior, when both exist
+    if "inference" in idata.posterior.attrs and reference_idata is not None:
+        if isinstance(reference_idata, str):
+            reference_idata = az.from_netcdf(reference_idata)
+        comparison = compare_approximation(idata, reference_idata, var_names=clean_var_names)
+        comparison_path = os.path.join(output_dir, f"survey_vi_vs_nuts_{label}.csv")
+        comparison.to_csv(comparison_path)
+        print(f"Approximation vs NUTS: max |std mean diff| = {comparison['std_mean_diff'].abs().max():.3f}, "
+              f"sd ratio range = [{comparison['sd_ratio'].min():.3f}, {comparison['sd_ratio'].max():.3f}]")
+
     # Calculate and save Odds Ratio summary (only for B02)
     if "effect" in idata.posterior:
         try:
@@ -110,63 +221,24 @@ def run_and_summarize(data, model_func, label="b02", output_dir="../results", **
     else:
         print("Model does not have 'effect' parameter. Skipping OR calculation.")
 
+    # Odds ratios of every level against the intercept and of every pair of levels
+    contrasts_path = os.path.join(output_dir, f"survey_contrast_or_{label}.csv")
+    calculate_contrast_odds_ratios(idata).to_csv(contrasts_path)
+
     # Save WAIC, LOO, BIC as a markdown file
     metrics_path = os.path.join(output_dir, f"survey_model_metrics_{label}.md")
-    with open(metrics_path, "w") as f:
-        f.write(f"## Model {label.upper()} Metrics\n\n")
-        f.write("### WAIC\n```\n" + waic.to_string() + "\n```\n")
-        f.write("### LOO\n```\n" + loo.to_string() + "\n```\n")
-        f.write(f"### BIC\n```\n\nBIC = {bic:.2f}\n```")
-
-    # Trace plot (excluding 'p')
-    trace_vars = [v for v in clean_var_names if v != "p"]
-    if trace_vars:
-        trace_plot_path = os.path.join(output_dir, f"survey_trace_{label}.png")
-        az.plot_trace(idata, var_names=trace_vars)
-        plt.tight_layout()
-        plt.savefig(trace_plot_path, dpi=300)
-        plt.close()
-
-    # Posterior plot for effect (if exists)
-    if "effect" in idata.posterior:
-        effect_plot_path = os.path.join(output_dir, f"survey_posterior_effect_{label}.png")
-        az.plot_posterior(idata, var_names=["effect"])
-        plt.tight_layout()
-        plt.savefig(effect_plot_path, dpi=300)
-        plt.close()
-
-    # Posterior plot for a subset of 'p'
-    if "p" in idata.posterior:
-        try:
-            obs_count = idata.posterior["p"].shape[-1]
-            plot_indices = np.random.choice(obs_count, size=min(20, obs_count), replace=False)
-            posterior_plot_path = os.path.join(output_dir, f"survey_posterior_p_{label}.png")
-            az.plot_posterior(idata, var_names=["p"], coords={"obs": plot_indices})
-            plt.tight_layout()
-            plt.savefig(posterior_plot_path, dpi=300)
-            plt.close()
-        except Exception as e:
-            print(f"⚠️ Failed to plot 'p': {e}")
-
-    # Posterior predictive check
-    try:
-        ppc_plot_path = os.path.join(output_dir, f"survey_ppc_{label}.png")
-        az.plot_ppc(idata)
-        plt.tight_layout()
-        plt.savefig(ppc_plot_path, dpi=300)
-        plt.close()
-    except Exception as e:
-        print(f"⚠️ Failed to plot PPC: {e}")
-
-    # Rank plot for diagnostics
-    try:
-        rank_plot_path = os.path.join(output_dir, f"survey_rank_{label}.png")
-        az.plot_rank(idata, var_names=trace_vars)
-        plt.tight_layout()
-        plt.savefig(rank_plot_path, dpi=300)
-        plt.close()
-    except Exception as e:
-        print(f"⚠️ Failed to create rank plot: {e}")
+    save_model_metrics(label, waic, loo, bic, metrics_path)
+
+    # Plots: trace (excluding 'p'), effect posterior, a subset of 'p', PPC and rank plot,
+    # rendered concurrently from the saved idata
+    trace_vars = [v for v in clean_var_names if v not in ("p", "p_level")]
+    p_subset = None
+    if "p" in plots and ("p" in idata.posterior or "p_level" in idata.posterior):
+        obs_count = idata.constant_data.sizes["obs"] if "p_level" in idata.posterior else idata.posterior["p"].shape[-1]
+        plot_indices = np.random.choice(obs_count, size=min(20, obs_count), replace=False)
+        p_subset = posterior_p(idata, obs=plot_indices).to_dataset()
+    render_plots(idata_path, label, output_dir, plots=plots, var_names=trace_vars, p_subset=p_subset,
+                 dpi=plot_dpi, fmt=plot_format, max_workers=plot_workers, downsample=plot_downsample)
 
     print(f"✅ Saved all outputs for model {label.upper()} in '{output_dir}' folder.")
     return idata, waic, loo, bic
@@ -175,17 +247,22 @@ import arviz as az
 import numpy as np
 import matplotlib.pyplot as plt
 
-def run_model_diagnostics(idata, model_name="Model", output_dir="../results"):
+def run_model_diagnostics(idata, model_name="Model", output_dir="../results", var_names=None):
     """
     Performs standard Bayesian diagnostics on a PyMC InferenceData object.
     Saves plots and prints summary messages for convergence, divergences, etc.
+    The diagnostics come from get_diagnostics, so after run_and_summarize they are not recomputed;
+    var_names selects other variables (default: those of the last diagnostics pass, or
+    DIAGNOSTIC_VARS). They are also saved as {model_name}_diagnostics.json.
     """
     import os
     os.makedirs(output_dir, exist_ok=True)
     print(f"\n🔍 Running diagnostics for {model_name}...\n")
+    diagnostics = get_diagnostics(idata, var_names)
+    save_diagnostics(diagnostics, os.path.join(output_dir, f"{model_name.lower()}_diagnostics.json"))
 
     # --- R-hat and ESS ---
-    summary = az.summary(idata)
+    summary = diagnostics["summary"]
     rhat_issues = summary["r_hat"].dropna() > 1.05
     ess_bulk_issues = summary["ess_bulk"].dropna() < 200
     
@@ -205,14 +282,16 @@ def run_model_diagnostics(idata, model_name="Model", output_dir="../results"):
 
     print("\n📏 ESS (tail) summary:")
     print(summary["ess_tail"].dropna())
-    if summary.loc["effect", "ess_tail"] < 1000:
+    if "effect" not in summary.index:
+        print("ℹ️ No 'effect' parameter, ESS_tail check skipped.")
+    elif summary.loc["effect", "ess_tail"] < 1000:
         print("⚠️ ESS_tail for 'effect' is below 1000")
     else:
         print("✅ ESS_tail for 'effect' is ≥ 1000")
 
     # --- Divergences ---
-    if "diverging" in idata.sample_stats:
-        n_divergences = idata.sample_stats["diverging"].sum().values
+    if diagnostics["divergences"] is not None:
+        n_divergences = diagnostics["divergences"]
         print(f"\n🚨 Divergences: {n_divergences}")
         if n_divergences > 0:
             print("⚠️ Consider increasing `target_accept` or reparameterizing.")
@@ -222,8 +301,8 @@ def run_model_diagnostics(idata, model_name="Model", output_dir="../results"):
         print("ℹ️ Divergence info not available.")
 
     # --- Tree Depth ---
-    if "depth" in idata.sample_stats:
-        max_depth = idata.sample_stats["depth"].max().values
+    if diagnostics["max_tree_depth"] is not None:
+        max_depth = diagnostics["max_tree_depth"]
         print(f"\n🌲 Max tree depth reached: {max_depth}")
         if max_depth >= 10:
             print("⚠️ Consider increasing `max_treedepth` if sampling is inefficient.")
@@ -232,6 +311,14 @@ def run_model_diagnostics(idata, model_name="Model", output_dir="../results"):
     else:
         print("ℹ️ Tree depth info not available.")
 
+    # --- E-BFMI ---
+    if diagnostics["bfmi"] is not None:
+        print(f"\n⚡ E-BFMI per chain: {', '.join(f'{value:.2f}' for value in diagnostics['bfmi'])}")
+        if min(diagnostics["bfmi"]) < 0.3:
+            print("⚠️ E-BFMI below 0.3: the sampler explores the energy distribution poorly.")
+        else:
+            print("✅ E-BFMI is within acceptable range.")
+
     # --- Energy plot (E-BFMI) ---
     energy_plot_path = os.path.join(output_dir, f"{model_name.lower()}_energy_plot.png")
     az.plot_energy(idata)
@@ -267,10 +354,27 @@ d = d.rename(columns=new_columns)
 
 d.columns
 
-#Merge the predictor columns
-d["I_I"] = merge_columns(d["C027"], d["C079"])
+#Likert scale in english and its codes
+mapping = {'Egyetértek': 'I Agree', 'Egyáltalán nem értek egyet': 'I Completely Disagree', 'Nem értek egyet': 'I Do Not Agree', 'Teljesen egyetértek': 'I totally Agree'}
+likert_mapping = {
+    "I Completely Disagree": 1,
+    "I Do Not Agree": 2,
+    "I Agree": 3,
+    "I totally Agree": 4
+}
+likert_labels = {code: label for label, code in likert_mapping.items()}
+
+#Merge the predictor columns: every PastEx/PresentEx pair of TRAIT_PAIRS (I_I = C027/C079, a-g of
+#B04_Report.md) is coalesced at once into Likert codes (int8, MISSING_CODE for empty/unmapped)
+from survey_data import encode_likert, coalesce_trait_pairs, TRAIT_PAIRS, MISSING_CODE
+hungarian_codes = {answer: likert_mapping[english] for answer, english in mapping.items()}
+merged_traits = coalesce_trait_pairs(d, hungarian_codes)
+d["I_I_numeric"] = merged_traits["I_I"]
+d["I_I"] = d["I_I_numeric"].map(likert_labels)
 print("\nDataframe with merged \"I_I\" columns (first 5 rows of relevant columns):")
 print(d[["C027", "C079", "I_I"]].head())
+print("\nMerged PastEx/PresentEx predictors (first 5 rows):")
+print(merged_traits.head())
 
 #Prepare the outcome variable
 print("\nUnique values in the outcome columns (C004):")
@@ -284,11 +388,6 @@ print(d[["C004", "outcome_binary"]].head())
 print("\nUnique values in the merged 'I_I' column:")
 print(d["I_I"].unique())
 
-#Change values of the likert scale to english
-mapping = {'Egyetértek': 'I Agree', 'Egyáltalán nem értek egyet': 'I Completely Disagree', 'Nem értek egyet': 'I Do Not Agree', 'Teljesen egyetértek': 'I totally Agree'}
-d["I_I"] = d["I_I"].map(mapping)
-print("\nUnique values in the 'I_I' column after mapping:")
-print(d["I_I"].unique())
 
 d.describe()
 
@@ -296,48 +395,46 @@ d.info()
 
 d.isna().sum()
 
-likert_mapping = {
-    "I Completely Disagree": 1,
-    "I Do Not Agree": 2,
-    "I Agree": 3,
-    "I totally Agree": 4
-}
-d["I_I_numeric"] = d["I_I"].map(likert_mapping)
-
 d.describe()
 
-#Prepare data for the Bayesian model
-y = d["outcome_binary"].values
-X = d["I_I_numeric"].values
-
-d_model = pd.DataFrame({
-        "predictor": X,
-        "outcome": y
-    })
+# Store this wave's sufficient statistics: Likert histogram and (level, outcome) counts of I_I.
+# The model data and the contingency table below are read from the store (all stored waves).
+from survey_data import SurveyStatsStore, SURVEY_STATS_DIR
+SURVEY_WAVE = "2023-11-14"
+stats_store = SurveyStatsStore(SURVEY_STATS_DIR)
+stats_store.add_wave(SURVEY_WAVE, d[["I_I_numeric"]].rename(columns={"I_I_numeric": "I_I"}),
+                     outcomes={"outcome_binary": d["outcome_binary"]})
+
+#Prepare data for the Bayesian model (respondents with a missing or unmapped 'I_I' answer are not counted)
+n_missing = (d["I_I_numeric"] == MISSING_CODE).sum()
+if n_missing:
+    print(f"⚠️ Leaving out {n_missing} respondents with a missing or unmapped 'I_I' answer.")
+d_model = stats_store.model_data("I_I", "outcome_binary")
 d_model.head()
 
 # Generate 2x4 contingency table: Outcome vs I_I levels
-contingency_table = pd.crosstab(d["I_I"], d["outcome_binary"])
+contingency_table = stats_store.contingency_table("I_I", "outcome_binary").rename(index=likert_labels)
 contingency_table.columns = ["PresentEx (0)", "PastEx (1)"]
 contingency_table.index.name = "Likert Scale"
 print("\n2x4 Contingency Table (Likert Scale × Outcome):")
 print(contingency_table)
 
-# Add log(odds) column
-def compute_log_odds(row):
-    PastEx = row["PastEx (1)"]
-    PresentEx = row["PresentEx (0)"]
-    if PastEx == 0 or PresentEx == 0:
-        return np.nan  # avoid division by zero
-    return np.log(PastEx / PresentEx)
-
-contingency_table["log(odds)"] = contingency_table.apply(
-    lambda row: compute_log_odds(row),
-    axis=1
-)
+# Add log(odds) column (NaN where either count is zero)
+counts = contingency_table[["PastEx (1)", "PresentEx (0)"]].to_numpy()
+with np.errstate(divide="ignore", invalid="ignore"):
+    contingency_table["log(odds)"] = np.where((counts > 0).all(axis=1), np.log(counts[:, 0] / counts[:, 1]), np.nan)
 print("\nContingency Table with log(odds) added:")
 print(contingency_table)
 
+# Level x outcome tables and log(odds) of every Likert trait column against C004, from one bincount
+from survey_data import contingency_log_odds
+trait_columns = [col for col in d.columns if col.startswith("C") and d[col].isin(list(mapping)).any()]
+trait_codes = encode_likert(d, trait_columns, hungarian_codes)
+trait_log_odds, trait_log_odds_array = contingency_log_odds(trait_codes, d["outcome_binary"], levels=[1, 2, 3, 4])
+trait_log_odds.to_csv("../results/survey_trait_log_odds.csv", index=False)
+print(f"\nLog(odds) of {len(trait_columns)} trait columns against C004 (first rows):")
+print(trait_log_odds.head(8))
+
 # Run and save results for B02 for survey data
 print("\nResults for B02 Model on survey data:")
 idata, *_ = run_and_summarize(d_model, ordinal_predictor_binary_outcome_model, label = "b02", shape = 3)
@@ -3,75 +3,1022 @@ import numpy as np
 import arviz as az
 import pytensor.tensor as pt
 import random
+import json
+import os
+import time
+import pickle
+import hashlib
+import inspect
+import weakref
+import warnings
 import pytensor
+import xarray as xr
+from pymc.model.fgraph import clone_model
+from scipy.special import logsumexp
+from pymc.step_methods.hmc.quadpotential import QuadPotentialDiagAdapt
+from pymc.step_methods.step_sizes import DualAverageAdaptation
 
-def ordinal_predictor_binary_outcome_model(predictor, outcome, variant="B02", seed = 42, shape = 4):
+SAMPLER_BACKENDS = ("pymc", "nutpie", "numpyro", "blackjax")
+VI_METHODS = ("advi", "fullrank_advi", "pathfinder")
+
+
+def level_counts(predictor, outcome, n_levels):
     """
-    PyMC model with a binary outcome and an ordinal predictor with a normal random walk constraint.
-    If variant=="B01", uses B01 priors else uses B02 with fluctuations around an estimated effect.
-    Returns model, idata, waic, loo, bic.
+    Reduces per-respondent data to the binomial sufficient statistics of each predictor level.
+    Returns (successes, trials), two integer arrays of length n_levels where entry k
+    belongs to predictor level k + 1.
     """
-    #--- Robust Reproducibility Setup ---
-    random.seed(seed)
-    np.random.seed(seed)
-    pytensor.config.on_opt_error = 'raise'
+    level_index = np.asarray(predictor, dtype=int) - 1
+    outcome = np.asarray(outcome, dtype=int)
+    trials = np.bincount(level_index, minlength=n_levels)
+    successes = np.bincount(level_index, weights=outcome, minlength=n_levels).astype(int)
+    return successes, trials
 
-    with pm.Model() as model:
-        # Define the 'obs' dimension
-        n_obs = len(outcome)
-        model.add_coord("obs", np.arange(n_obs))
-      
 
-        if variant == "B01":
-            # B01: no "effect" or "sd_fluctuation"; level_effects_diff is N(0,2)
-            intercept = pm.Normal("intercept", mu=0, sigma=2.5)
-            level_effects_diff = pm.Normal("level_effects_diff", mu=0, sigma=2, shape=shape)
+def default_p_storage(likelihood):
+    """The p_storage used when none is given: per level for the binomial likelihood, per observation otherwise."""
+    return "level" if likelihood == "binomial" else "obs"
+
+
+def default_loglik(likelihood):
+    """The loglik used when none is given: grouped for the binomial likelihood, pointwise otherwise."""
+    return "grouped" if likelihood == "binomial" else "pointwise"
+
+
+def backend_sample_kwargs(backend, max_treedepth=10, cores=4):
+    """
+    Returns the pm.sample keyword arguments that select an external NUTS backend: "nutpie"
+    (compiled, its chains run on `cores` threads) or "numpyro"/"blackjax" (JAX on CPU, the chains
+    vectorized on one device, so `cores` is not used). They return an InferenceData with the same
+    groups as PyMC's own NUTS, which ReusableOrdinalModel.fit runs with its cached step methods.
+    """
+    if backend == "nutpie":
+        sampler_kwargs = {"maxdepth": max_treedepth, "save_warmup": False, "cores": cores}
+    elif backend == "numpyro":
+        sampler_kwargs = {"nuts_kwargs": {"max_tree_depth": max_treedepth},
+                          "chain_method": "vectorized", "postprocessing_backend": "cpu"}
+    elif backend == "blackjax":
+        sampler_kwargs = {"chain_method": "vectorized", "postprocessing_backend": "cpu"}
+    else:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {SAMPLER_BACKENDS[1:]}.")
+    return {"nuts_sampler": backend, "nuts_sampler_kwargs": sampler_kwargs}
+
+
+def fit_approximation(model, method="advi", n=20000, draws=4000, seed=42):
+    """
+    Fits a variational ("advi", "fullrank_advi") or Pathfinder ("pathfinder", needs the optional
+    pymc_extras package) approximation to the model in context and draws `draws` samples from it.
+    Returns an InferenceData with a single chain and the same posterior variables as pm.sample;
+    the method is recorded in idata.posterior.attrs["inference"].
+    """
+    if method not in VI_METHODS:
+        raise ValueError(f"Unknown vi_method '{method}', expected one of {VI_METHODS}.")
+    if method == "pathfinder":
+        try:
+            import pymc_extras as pmx
+        except ImportError as error:
+            raise ImportError("vi_method='pathfinder' requires pymc_extras (pip install pymc-extras).") from error
+        idata = pmx.fit(method="pathfinder", num_draws=draws, random_seed=seed)
+        idata.posterior.attrs["inference"] = method
+        return idata
+    approx = pm.fit(n=n, method=method, random_seed=seed, progressbar=False)
+    idata = approx.sample(draws, random_seed=seed, return_inferencedata=True)
+    # approx.sample names the dimensions var_dim_0, ...; restore the model's dims and coords
+    renamed = {}
+    for name, dims in model.named_vars_to_dims.items():
+        if name in idata.posterior:
+            var = idata.posterior[name]
+            var = var.rename(dict(zip(var.dims[2:], dims)))
+            renamed[name] = var.assign_coords({dim: np.asarray(model.coords[dim]) for dim in dims})
+    idata.posterior = idata.posterior.drop_vars(list(renamed)).assign(renamed)
+    idata.posterior.attrs["inference"] = method
+    return idata
+
+
+def compare_approximation(idata_approx, idata_reference, var_names=None):
+    """
+    Measures how far an approximate posterior (VI/Pathfinder) is from a reference (NUTS) posterior.
+    For every element of the shared variables (or var_names) it reports both means and sds,
+    the mean difference in reference standard deviations and the sd ratio (approx / reference).
+    Returns a pandas DataFrame indexed like az.summary.
+    """
+    if var_names is None:
+        var_names = [name for name in idata_approx.posterior.data_vars if name in idata_reference.posterior]
+    approx = az.summary(idata_approx, var_names=var_names, kind="stats", round_to="none")
+    reference = az.summary(idata_reference, var_names=var_names, kind="stats", round_to="none")
+    comparison = reference[["mean", "sd"]].join(approx[["mean", "sd"]], lsuffix="_nuts", rsuffix="_vi")
+    comparison["std_mean_diff"] = (comparison["mean_vi"] - comparison["mean_nuts"]) / comparison["sd_nuts"]
+    comparison["sd_ratio"] = comparison["sd_vi"] / comparison["sd_nuts"]
+    return comparison
+
+
+def _y_pred_rv(model, likelihood):
+    """Adds the unobserved y_pred variable to the model in context, built from its named variables."""
+    if "p_level" in model.named_vars:
+        p_level = model["p_level"]
+    else:
+        p_level = pm.math.sigmoid(model["intercept"] + model["level_effects"])
+    if likelihood == "binomial":
+        # Number of successes per level
+        return pm.Binomial("y_pred", n=model["trials"], p=p_level, observed=None, dims="level")
+    p = model["p"] if "p" in model.named_vars else p_level[model["predictor"] - 1]
+    return pm.Bernoulli("y_pred", p=p, observed=None, dims="obs")
+
+
+def posterior_p_level(idata):
+    """
+    Per-level success probabilities with dims (chain, draw, level).
+    Uses the stored p_level, or rebuilds it from intercept and level_effects.
+    """
+    posterior = idata.posterior
+    if "p_level" in posterior:
+        return posterior["p_level"]
+    level_effects = posterior["level_effects"].rename({posterior["level_effects"].dims[-1]: "level"})
+    level_effects = level_effects.assign_coords(level=np.arange(1, level_effects.sizes["level"] + 1))
+    return 1 / (1 + np.exp(-(posterior["intercept"] + level_effects)))
+
+
+def posterior_p(idata, obs=None):
+    """
+    Per-observation success probabilities p with dims (chain, draw, obs).
+    Returns the stored p, or expands the per-level probabilities through the predictor in
+    idata.constant_data. obs optionally selects observations, so only those are materialized.
+    """
+    if "p" in idata.posterior:
+        p = idata.posterior["p"]
+        return p if obs is None else p.isel(obs=obs)
+    predictor = idata.constant_data["predictor"]
+    if obs is not None:
+        predictor = predictor.isel(obs=obs)
+    return posterior_p_level(idata).sel(level=predictor).drop_vars("level").rename("p")
+
+
+def fast_posterior_predictive(idata, likelihood="bernoulli", var_names=("y_obs",), seed=None, chunk_draws=1000):
+    """
+    Posterior predictive draws generated directly from the posterior with NumPy.
+    For the Bernoulli likelihood each variable is one batched `rng.random(...) < p` over
+    (chain, draw, obs); for the binomial likelihood it is `rng.binomial(trials, p_level)`
+    over (chain, draw, level). Draws are generated chunk_draws at a time into a preallocated
+    array, and the variables are written into idata.posterior_predictive.
+    Returns idata.
+    """
+    rng = np.random.default_rng(seed)
+    p_level = posterior_p_level(idata).transpose("chain", "draw", "level")
+    p_level_values = p_level.values
+    n_chains, n_draws, _ = p_level_values.shape
+    if likelihood == "binomial":
+        trials = idata.constant_data["trials"].values
+        dim, dim_values = "level", p_level["level"].values
+    else:
+        level_index = np.searchsorted(p_level["level"].values, idata.constant_data["predictor"].values)
+        dim, dim_values = "obs", idata.constant_data["obs"].values
+    coords = {"chain": p_level["chain"].values, "draw": p_level["draw"].values, dim: dim_values}
+
+    predictions = {}
+    for name in var_names:
+        values = np.empty((n_chains, n_draws, len(dim_values)), dtype=np.int64)
+        for start in range(0, n_draws, chunk_draws):
+            chunk = p_level_values[:, start:start + chunk_draws]
+            if likelihood == "binomial":
+                values[:, start:start + chunk_draws] = rng.binomial(trials, chunk)
+            else:
+                chunk = chunk[..., level_index]
+                values[:, start:start + chunk_draws] = rng.random(chunk.shape) < chunk
+        predictions[name] = xr.DataArray(values, dims=("chain", "draw", dim), coords=coords)
+
+    if "posterior_predictive" in idata:
+        idata.posterior_predictive = idata.posterior_predictive.assign(predictions)
+    else:
+        idata.add_groups(posterior_predictive=xr.Dataset(predictions))
+    return idata
+
+
+def grouped_log_likelihood(idata, predictor, outcome):
+    """
+    Stores the Bernoulli log likelihood once per unique (predictor level, outcome) pattern.
+    Respondents sharing a pattern have identical pointwise log likelihoods, so
+    idata.log_likelihood["y_obs"] gets dims (chain, draw, pattern) and idata.constant_data gets
+    pattern_level, pattern_outcome, pattern_weight (multiplicity) and obs_pattern (the pattern of
+    each observation). weighted_waic and weighted_loo read this form.
+    Returns idata.
+    """
+    observations = np.column_stack([np.asarray(predictor, dtype=int), np.asarray(outcome, dtype=int)])
+    patterns, obs_pattern, weights = np.unique(observations, axis=0, return_inverse=True, return_counts=True)
+    pattern_level = xr.DataArray(patterns[:, 0], dims="pattern")
+    pattern_outcome = xr.DataArray(patterns[:, 1], dims="pattern")
+
+    p_pattern = posterior_p_level(idata).sel(level=pattern_level).drop_vars("level")
+    log_lik = xr.where(pattern_outcome == 1, np.log(p_pattern), np.log1p(-p_pattern))
+    log_lik = log_lik.transpose("chain", "draw", "pattern")
+    if "log_likelihood" in idata:
+        del idata.log_likelihood
+    idata.add_groups(log_likelihood=xr.Dataset({"y_obs": log_lik}))
+
+    pattern_data = xr.Dataset({
+        "pattern_level": pattern_level,
+        "pattern_outcome": pattern_outcome,
+        "pattern_weight": xr.DataArray(weights, dims="pattern"),
+        "obs_pattern": xr.DataArray(obs_pattern.ravel(), dims="obs", coords={"obs": idata.constant_data["obs"]}),
+    })
+    idata.constant_data = idata.constant_data.assign(pattern_data)
+    return idata
+
+
+def _pattern_log_likelihood(idata):
+    """Pattern log likelihoods as (pattern, sample), with their weights and the obs -> pattern map."""
+    log_lik = idata.log_likelihood["y_obs"].stack(__sample__=("chain", "draw")).transpose("pattern", "__sample__")
+    weights = idata.constant_data["pattern_weight"].values
+    obs_pattern = idata.constant_data["obs_pattern"]
+    return log_lik.values, weights, obs_pattern
+
+
+_SCALE_VALUES = {"log": 1, "negative_log": -1, "deviance": -2}
+
+
+def weighted_waic(idata, scale="log"):
+    """
+    WAIC from the grouped log likelihood (see grouped_log_likelihood).
+    Each pattern's contribution is counted pattern_weight times, which gives the same
+    elpd_waic, se and p_waic as az.waic on the per-observation log likelihood.
+    Returns an az.ELPDData in the same layout as az.waic(pointwise=True).
+    """
+    scale_value = _SCALE_VALUES[scale]
+    log_lik, weights, obs_pattern = _pattern_log_likelihood(idata)
+    n_samples = log_lik.shape[1]
+    n_data_points = int(weights.sum())
+
+    lppd = logsumexp(log_lik, axis=1) - np.log(n_samples)
+    vars_lpd = log_lik.var(axis=1)
+    warn_mg = bool(np.any(vars_lpd > 0.4))
+    if warn_mg:
+        warnings.warn(
+            "For one or more samples the posterior variance of the log predictive "
+            "densities exceeds 0.4. This could be indication of WAIC starting to fail. \n"
+            "See http://arxiv.org/abs/1507.04544 for details"
+        )
+
+    waic_pattern = scale_value * (lppd - vars_lpd)
+    waic_sum = np.sum(weights * waic_pattern)
+    waic_se = np.sqrt(np.sum(weights * (waic_pattern - waic_sum / n_data_points) ** 2))
+    p_waic = np.sum(weights * vars_lpd)
+    waic_i = xr.DataArray(waic_pattern, dims="pattern")[obs_pattern].drop_vars("pattern", errors="ignore")
+    return az.ELPDData(
+        data=[waic_sum, waic_se, p_waic, n_samples, n_data_points, warn_mg, waic_i.rename("waic_i"), scale],
+        index=["elpd_waic", "se", "p_waic", "n_samples", "n_data_points", "warning", "waic_i", "scale"],
+    )
+
+
+def weighted_loo(idata, scale="log", reff=None):
+    """
+    PSIS-LOO from the grouped log likelihood (see grouped_log_likelihood).
+    Observations sharing a pattern have the same importance ratios, so PSIS runs once per
+    pattern and the results are counted pattern_weight times. reff defaults to the value
+    az.loo computes from the posterior, so elpd_loo matches az.loo on the per-observation form.
+    Returns an az.ELPDData in the same layout as az.loo(pointwise=True).
+    """
+    scale_value = _SCALE_VALUES[scale]
+    log_lik, weights, obs_pattern = _pattern_log_likelihood(idata)
+    n_samples = log_lik.shape[1]
+    n_data_points = int(weights.sum())
+    if reff is None:
+        if idata.posterior.sizes["chain"] == 1:
+            reff = 1.0
         else:
-            # B02: has "effect" and "sd_fluctuation"; level_effects_diff ~ N(effect, sd_fluctuation)
-            effect = pm.Normal("effect", mu=0, sigma=0.55)
-            sd_fluctuation = pm.HalfNormal("sd_fluctuation", sigma = 1)
-            intercept = pm.Normal("intercept", mu=0, sigma=abs(effect) + 1e-3)
-
-            level_effects_diff = pm.Normal("level_effects_diff", mu=effect, sigma=sd_fluctuation, shape=shape)
-
-        # Centered level effects
-        raw_effects = pm.math.concatenate([[0], pm.math.cumsum(level_effects_diff)])
-        centered_effects = raw_effects - pt.mean(raw_effects)
-        level_effects = pm.Deterministic("level_effects", centered_effects)
-        
-        #Linear predictor
-        logit_p = intercept + (centered_effects[predictor - 1])
-        p = pm.Deterministic("p", pm.math.sigmoid(logit_p), dims="obs")  # Dimension 'p' by 'obs'
-
-        # Likelihood - Associate observed data with 'obs' dimension
-        y_obs = pm.Bernoulli("y_obs", p=p, observed=outcome, dims="obs")
-
-        # Posterior predictive samples
-        y_pred = pm.Bernoulli("y_pred", p=p, observed=None, dims="obs")
-
-        # Sampling - Request log_likelihood
-        idata = pm.sample(
-            10000,
-            tune=10000,
-            random_seed=seed,
-            return_inferencedata=True,
-            target_accept=0.97,  # Increased target_accept
-            init = "adapt_diag",
-	    chains = 4,
-	    cores = 4,
-            idata_kwargs={"log_likelihood": True},
-            nuts={"max_treedepth": 15}  
+            ess_p = az.ess(idata.posterior, method="mean")
+            reff = np.hstack([ess_p[v].values.flatten() for v in ess_p.data_vars]).mean() / n_samples
+
+    log_weights, pareto_shape = az.psislw(-log_lik, reff)
+    log_weights += log_lik
+    good_k = min(1 - 1 / np.log10(n_samples), 0.7)
+    warn_mg = bool(np.any(pareto_shape > good_k))
+    if warn_mg:
+        warnings.warn(
+            f"Estimated shape parameter of Pareto distribution is greater than {good_k:.2f} "
+            "for one or more samples. You should consider using a more robust model, this is "
+            "because importance sampling is less likely to work well if the marginal posterior "
+            "and LOO posterior are very different. This is more likely to happen with a "
+            "non-robust model and highly influential observations."
         )
-        idata.extend(pm.sample_posterior_predictive(idata))
 
-        waic = az.waic(idata)
-        loo = az.loo(idata)
+    loo_pattern = scale_value * logsumexp(log_weights, axis=1)
+    loo_lppd = np.sum(weights * loo_pattern)
+    loo_lppd_se = np.sqrt(np.sum(weights * (loo_pattern - loo_lppd / n_data_points) ** 2))
+    lppd = np.sum(weights * (logsumexp(log_lik, axis=1) - np.log(n_samples)))
+    p_loo = lppd - loo_lppd / scale_value
+    loo_i = xr.DataArray(loo_pattern, dims="pattern")[obs_pattern].drop_vars("pattern", errors="ignore")
+    pareto_k = xr.DataArray(pareto_shape, dims="pattern")[obs_pattern].drop_vars("pattern", errors="ignore")
+    return az.ELPDData(
+        data=[loo_lppd, loo_lppd_se, p_loo, n_samples, n_data_points, warn_mg, loo_i.rename("loo_i"),
+              pareto_k.rename("pareto_shape"), scale, good_k],
+        index=["elpd_loo", "se", "p_loo", "n_samples", "n_data_points", "warning", "loo_i", "pareto_k",
+               "scale", "good_k"],
+    )
+
+
+# NUTS settings per parameterization of the B02 hierarchy. Both forms need a high target_accept and
+# deep trees: at PyMC's defaults (0.8, 10) the non-centered form still diverges on small-effect data.
+# fit(target_accept=..., max_treedepth=...) overrides them.
+NUTS_SETTINGS = {
+    "centered": {"target_accept": 0.97, "max_treedepth": 15},
+    "noncentered": {"target_accept": 0.99, "max_treedepth": 15},
+}
+
+
+def choose_parameterization(predictor, outcome, shape=4):
+    """
+    Picks the parameterization of the B02 intercept and level_effects_diff from the data.
+    The empirical log odds of each level give the observed level differences and their
+    sampling variances; the between-difference variance (sd_fluctuation**2) is estimated by
+    the method of moments. When the sampling noise dominates, the likelihood barely informs
+    level_effects_diff and the centered form has a funnel, so "noncentered" is returned;
+    otherwise "centered".
+    """
+    successes, trials = level_counts(predictor, outcome, shape + 1)
+    observed = trials > 0
+    successes, trials = successes[observed], trials[observed]
+    if len(trials) < 3:
+        return "noncentered"
+    # 0.5 continuity correction keeps empty cells finite
+    log_odds = np.log((successes + 0.5) / (trials - successes + 0.5))
+    sampling_var = 1 / (successes + 0.5) + 1 / (trials - successes + 0.5)
+    diffs = np.diff(log_odds)
+    diff_var = sampling_var[1:] + sampling_var[:-1]
+    fluctuation_var = max(np.var(diffs, ddof=1) - np.mean(diff_var), 0.0)
+    return "noncentered" if np.mean(diff_var) > fluctuation_var else "centered"
+
+
+# Thresholds checked by run_model_diagnostics, used as the default ESS stopping targets
+ESS_STOPPING_TARGETS = {"ess_bulk": 200, "ess_tail_effect": 1000, "r_hat": 1.05}
+
+
+def check_stopping_targets(idata, targets=None):
+    """
+    Checks the ESS and R-hat stopping targets on the model parameters.
+    targets has the keys of ESS_STOPPING_TARGETS: minimum bulk ESS of every parameter, minimum
+    tail ESS of 'effect' (skipped for B01, which has no 'effect') and maximum R-hat.
+    Returns (met, reason) where reason describes the values that were checked.
+    """
+    targets = {**ESS_STOPPING_TARGETS, **(targets or {})}
+    var_names = [v for v in ("intercept", "level_effects", "effect", "sd_fluctuation") if v in idata.posterior]
+    ess_bulk = float(az.ess(idata, var_names=var_names, method="bulk").to_array().min())
+    r_hat = float(az.rhat(idata, var_names=var_names).to_array().max())
+    checks = [
+        (f"min ESS bulk {ess_bulk:.0f} (target >= {targets['ess_bulk']})", ess_bulk >= targets["ess_bulk"]),
+        (f"max R-hat {r_hat:.3f} (target < {targets['r_hat']})", r_hat < targets["r_hat"]),
+    ]
+    if "effect" in idata.posterior:
+        ess_tail = float(az.ess(idata, var_names=["effect"], method="tail")["effect"])
+        checks.append((f"ESS tail of 'effect' {ess_tail:.0f} (target >= {targets['ess_tail_effect']})",
+                       ess_tail >= targets["ess_tail_effect"]))
+    met = all(ok for _, ok in checks)
+    return met, "; ".join(text for text, _ in checks)
+
+
+# Parameters the diagnostics are computed for by default (the per-observation p is left out)
+DIAGNOSTIC_VARS = ("intercept", "level_effects", "effect", "sd_fluctuation")
+
+# Diagnostics per InferenceData, keyed by id() (InferenceData is an unhashable Mapping);
+# an entry is dropped when its InferenceData is garbage collected
+_DIAGNOSTICS_CACHE = {}
+
+
+def compute_diagnostics(idata, var_names=None):
+    """
+    Computes the convergence diagnostics of a fit in one pass: the az.summary table (mean, sd,
+    HDI, MCSE, bulk/tail ESS, R-hat) of var_names (default DIAGNOSTIC_VARS present in the
+    posterior), the number of divergences, the maximum tree depth and the E-BFMI per chain.
+    Sampler statistics missing from the fit (VI, external backends) are reported as None.
+    Returns a dict.
+    """
+    if var_names is None:
+        var_names = [v for v in DIAGNOSTIC_VARS if v in idata.posterior]
+    sample_stats = idata.sample_stats if "sample_stats" in idata else None
+    diagnostics = {"var_names": list(var_names), "summary": az.summary(idata, var_names=list(var_names)),
+                   "divergences": None, "max_tree_depth": None, "bfmi": None}
+    if sample_stats is not None and "diverging" in sample_stats:
+        diagnostics["divergences"] = int(sample_stats["diverging"].sum())
+    if sample_stats is not None:
+        depth = "tree_depth" if "tree_depth" in sample_stats else "depth" if "depth" in sample_stats else None
+        if depth is not None:
+            diagnostics["max_tree_depth"] = int(sample_stats[depth].max())
+        if "energy" in sample_stats:
+            diagnostics["bfmi"] = [float(value) for value in az.bfmi(idata)]
+    return diagnostics
+
+
+def get_diagnostics(idata, var_names=None):
+    """
+    Returns the diagnostics of idata (see compute_diagnostics), computed once per InferenceData
+    object and var_names and reused by later calls. With var_names=None the most recently
+    computed diagnostics of idata are returned, if any.
+    """
+    if id(idata) not in _DIAGNOSTICS_CACHE:
+        _DIAGNOSTICS_CACHE[id(idata)] = {}
+        weakref.finalize(idata, _DIAGNOSTICS_CACHE.pop, id(idata), None)
+    cached = _DIAGNOSTICS_CACHE[id(idata)]
+    if var_names is None and cached:
+        return cached[next(reversed(cached))]
+    key = tuple(var_names) if var_names is not None else None
+    if key not in cached:
+        cached[key] = compute_diagnostics(idata, var_names)
+    return cached[key]
+
+
+def save_diagnostics(diagnostics, path):
+    """Writes diagnostics (see compute_diagnostics) as JSON, the summary table as one record per row."""
+    serializable = {**diagnostics, "summary": json.loads(diagnostics["summary"].to_json(orient="index"))}
+    with open(path, "w") as f:
+        json.dump(serializable, f, indent=2)
+
+
+def save_model_metrics(label, waic, loo, bic, path):
+    """Writes the WAIC, LOO and BIC of a fit as the Markdown metrics file of run_and_summarize."""
+    with open(path, "w") as f:
+        f.write(f"## Model {label.upper()} Metrics\n\n")
+        f.write("### WAIC\n```\n" + waic.to_string() + "\n```\n")
+        f.write("### LOO\n```\n" + loo.to_string() + "\n```\n")
+        f.write(f"### BIC\n```\n\nBIC = {bic:.2f}\n```")
+
+
+def extract_tuning(model, idata):
+    """
+    Recovers the adapted NUTS settings of a finished pymc-backend run.
+    The step size is the final adapted one (averaged over chains); the diagonal mass matrix is
+    estimated from the variance of the posterior draws in the unconstrained space, which is what
+    the diagonal adaptation converges to. Entries follow model.continuous_value_vars.
+    Returns a dict with "step_size", "mean" and "var".
+    """
+    means, variances = [], []
+    for value_var in model.continuous_value_vars:
+        rv = model.values_to_rvs[value_var]
+        draws = idata.posterior[rv.name].values
+        draws = draws.reshape(draws.shape[0] * draws.shape[1], -1)
+        transform = model.rvs_to_transforms.get(rv)
+        if transform is not None:
+            draws = transform.forward(pt.as_tensor(draws), *rv.owner.inputs).eval()
+        means.append(draws.mean(axis=0))
+        variances.append(draws.var(axis=0))
+    step_size = float(idata.sample_stats["step_size"].isel(draw=-1).mean())
+    return {"step_size": step_size, "mean": np.concatenate(means), "var": np.concatenate(variances)}
+
+
+def _set_step_state(nuts_step, potential, step_adapt):
+    """
+    Points nuts_step at a mass matrix (potential) and step size adaptation. The leapfrog
+    integrator PyMC builds with the step keeps its own reference to the potential, so it is
+    repointed too: otherwise momenta would be drawn from one mass matrix and integrated with another.
+    """
+    nuts_step.potential = potential
+    nuts_step.integrator._potential = potential
+    nuts_step.step_adapt = step_adapt
+
+
+def _warm_start_step(nuts_step, tuning, initial_weight=10):
+    """
+    Starts nuts_step from the given tuning instead of a unit mass matrix. Returns the
+    replaced (potential, step_adapt); _set_step_state(nuts_step, *previous) restores the
+    cached step afterwards.
+    """
+    previous = (nuts_step.potential, nuts_step.step_adapt)
+    potential = QuadPotentialDiagAdapt(
+        len(tuning["var"]), np.asarray(tuning["mean"]), np.asarray(tuning["var"]), initial_weight,
+        dtype=nuts_step.potential.dtype,
+    )
+    step_adapt = DualAverageAdaptation(tuning["step_size"], nuts_step.target_accept, 0.05, 0.75, 10)
+    _set_step_state(nuts_step, potential, step_adapt)
+    return previous
+
+
+def save_tuning(tuning, path):
+    """Writes a tuning dict (see extract_tuning) to a JSON file, e.g. next to idata_{label}.nc."""
+    serializable = {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in tuning.items()}
+    with open(path, "w") as f:
+        json.dump(serializable, f, indent=2)
+
+
+def load_tuning(path):
+    """Reads a tuning dict written by save_tuning."""
+    with open(path) as f:
+        tuning = json.load(f)
+    tuning["mean"] = np.asarray(tuning["mean"])
+    tuning["var"] = np.asarray(tuning["var"])
+    return tuning
+
+
+class ReusableOrdinalModel:
+    """
+    The B01/B02 ordinal predictor model built once with pm.Data containers for the data.
+    fit() re-points the containers at new predictor/outcome arrays and reuses the compiled
+    step methods (logp/dlogp graph), so refits across survey items, seeds or bootstrap replicates
+    do not pay the compile cost again. Only backend="pymc" reuses compiled steps; the
+    external backends compile their own sampler on every call.
+    inference="vi" fits an approximation (see fit_approximation) instead of running NUTS.
+    """
+
+    def __init__(self, variant="B02", shape=4, likelihood="bernoulli", backend="pymc",
+                 parameterization="centered", p_storage=None, inference="nuts"):
+        if p_storage is None:
+            p_storage = default_p_storage(likelihood)
+        if parameterization not in NUTS_SETTINGS:
+            raise ValueError(f"Unknown parameterization '{parameterization}', expected one of {tuple(NUTS_SETTINGS)}.")
+        if likelihood not in ("bernoulli", "binomial"):
+            raise ValueError(f"Unknown likelihood '{likelihood}', expected 'bernoulli' or 'binomial'.")
+        if p_storage not in ("obs", "level"):
+            raise ValueError(f"Unknown p_storage '{p_storage}', expected 'obs' or 'level'.")
+        if backend not in SAMPLER_BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {SAMPLER_BACKENDS}.")
+        if inference not in ("nuts", "vi"):
+            raise ValueError(f"Unknown inference '{inference}', expected 'nuts' or 'vi'.")
+        if inference == "vi" and backend != "pymc":
+            raise ValueError("inference='vi' is only supported with backend='pymc'.")
+        self.variant = variant
+        self.shape = shape
+        self.likelihood = likelihood
+        self.backend = backend
+        self.parameterization = parameterization
+        self.p_storage = p_storage
+        self.inference = inference
+        # The discrete y_pred can only be sampled inside the model by PyMC's own NUTS + Gibbs steps
+        self.y_pred_in_model = backend == "pymc" and inference == "nuts"
+        self.target_accept = NUTS_SETTINGS[parameterization]["target_accept"]
+        self.max_treedepth = NUTS_SETTINGS[parameterization]["max_treedepth"]
+        self.n_levels = shape + 1
+        self.model = self._build_model()
+        self._step_cache = {}
+
+    def _build_model(self):
+        shape = self.shape
+        n_levels = self.n_levels
+        # Placeholder data; fit() sets the real arrays before sampling
+        predictor = np.ones(1, dtype=int)
+        outcome = np.zeros(1, dtype=int)
+
+        with pm.Model() as model:
+            # Define the 'obs' dimension
+            model.add_coord("obs", np.arange(len(outcome)))
+            model.add_coord("level", np.arange(1, n_levels + 1))
+            predictor_data = pm.Data("predictor", predictor, dims="obs")
+
+            if self.variant == "B01":
+                # B01: no "effect" or "sd_fluctuation"; level_effects_diff is N(0,2)
+                intercept = pm.Normal("intercept", mu=0, sigma=2.5)
+                level_effects_diff = pm.Normal("level_effects_diff", mu=0, sigma=2, shape=shape)
+            else:
+                # B02: has "effect" and "sd_fluctuation"; level_effects_diff ~ N(effect, sd_fluctuation)
+                effect = pm.Normal("effect", mu=0, sigma=0.55)
+                sd_fluctuation = pm.HalfNormal("sd_fluctuation", sigma = 1)
+                if self.parameterization == "noncentered":
+                    # Same distributions, sampled as standard normal offsets scaled by their prior sd
+                    intercept_raw = pm.Normal("intercept_raw", mu=0, sigma=1)
+                    intercept = pm.Deterministic("intercept", (abs(effect) + 1e-3) * intercept_raw)
+                    level_effects_diff_raw = pm.Normal("level_effects_diff_raw", mu=0, sigma=1, shape=shape)
+                    level_effects_diff = pm.Deterministic("level_effects_diff",
+                                                          effect + sd_fluctuation * level_effects_diff_raw)
+                else:
+                    intercept = pm.Normal("intercept", mu=0, sigma=abs(effect) + 1e-3)
+                    level_effects_diff = pm.Normal("level_effects_diff", mu=effect, sigma=sd_fluctuation, shape=shape)
+
+            # Centered level effects
+            raw_effects = pm.math.concatenate([[0], pm.math.cumsum(level_effects_diff)])
+            centered_effects = raw_effects - pt.mean(raw_effects)
+            level_effects = pm.Deterministic("level_effects", centered_effects)
+
+            #Linear predictor
+            if self.p_storage == "level":
+                # Only the per-level probabilities are stored; p is expanded on demand (posterior_p)
+                p_level = pm.Deterministic("p_level", pm.math.sigmoid(intercept + centered_effects), dims="level")
+                p = p_level[predictor_data - 1]
+            else:
+                logit_p = intercept + (centered_effects[predictor_data - 1])
+                p = pm.Deterministic("p", pm.math.sigmoid(logit_p), dims="obs")  # Dimension 'p' by 'obs'
+                p_level = pm.math.sigmoid(intercept + centered_effects)
+
+            if self.likelihood == "binomial":
+                # Likelihood - one Binomial term per predictor level on the sufficient statistics
+                successes, trials = level_counts(predictor, outcome, n_levels)
+                successes_data = pm.Data("successes", successes, dims="level")
+                trials_data = pm.Data("trials", trials, dims="level")
+                y_obs = pm.Binomial("y_obs", n=trials_data, p=p_level, observed=successes_data, dims="level")
+            else:
+                # Likelihood - Associate observed data with 'obs' dimension
+                outcome_data = pm.Data("outcome", outcome, dims="obs")
+                y_obs = pm.Bernoulli("y_obs", p=p, observed=outcome_data, dims="obs")
+
+            # Posterior predictive samples. The compiled/JIT backends and VI only handle continuous
+            # variables, so for them y_pred is added after sampling and drawn with y_obs.
+            if self.y_pred_in_model:
+                y_pred = _y_pred_rv(model, self.likelihood)
+
+        return model
+
+    def set_data(self, predictor, outcome):
+        """Re-points the data containers at new predictor/outcome arrays."""
+        predictor = np.asarray(predictor, dtype=int)
+        outcome = np.asarray(outcome, dtype=int)
+        new_data = {"predictor": predictor}
+        if self.likelihood == "binomial":
+            new_data["successes"], new_data["trials"] = level_counts(predictor, outcome, self.n_levels)
+        else:
+            new_data["outcome"] = outcome
+        with self.model:
+            pm.set_data(new_data, coords={"obs": np.arange(len(outcome))})
+
+    def _steps(self, n_obs, target_accept=None, max_treedepth=None):
+        """
+        Step methods for the pymc backend, compiled once and reused across fits.
+        The Bernoulli model's y_pred has one entry per observation and its shape is fixed in the
+        compiled functions, so those steps are cached per number of observations; the binomial
+        model's steps do not depend on the data size. target_accept and max_treedepth default to
+        the parameterization's NUTS_SETTINGS; other values get their own cached steps.
+        """
+        target_accept = self.target_accept if target_accept is None else target_accept
+        max_treedepth = self.max_treedepth if max_treedepth is None else max_treedepth
+        key = (n_obs if self.likelihood == "bernoulli" else None, target_accept, max_treedepth)
+        if key not in self._step_cache:
+            with self.model:
+                nuts_step = pm.NUTS(
+                    vars=self.model.continuous_value_vars,
+                    target_accept=target_accept,
+                    max_treedepth=max_treedepth,
+                )
+                if self.likelihood == "bernoulli":
+                    y_pred_step = pm.BinaryGibbsMetropolis([self.model["y_pred"]])
+                else:
+                    y_pred_step = pm.Metropolis([self.model["y_pred"]])
+            self._step_cache[key] = [nuts_step, y_pred_step]
+        return self._step_cache[key]
+
+    def _tuning_config(self):
+        """The settings a saved tuning is tied to: it only fits a model with the same free variables."""
+        return {"variant": self.variant, "shape": self.shape, "likelihood": self.likelihood,
+                "parameterization": self.parameterization}
+
+    def _warm_start(self, nuts_step, tuning):
+        """Checks that tuning was saved for this configuration and warm-starts nuts_step from it."""
+        if isinstance(tuning, str):
+            tuning = load_tuning(tuning)
+        config = tuning.get("config")
+        if config is not None and config != self._tuning_config():
+            raise ValueError(f"init_tuning was saved for {config}, not {self._tuning_config()}.")
+        n_values = sum(int(np.prod(self.model.initial_point()[value_var.name].shape))
+                       for value_var in self.model.continuous_value_vars)
+        if len(tuning["var"]) != n_values:
+            raise ValueError(f"init_tuning has {len(tuning['var'])} entries, the model has {n_values}.")
+        return _warm_start_step(nuts_step, tuning)
+
+    def _sample_until_targets(self, steps, seed, draws, tune, block_draws, targets, log_likelihood,
+                              chains=4, cores=4):
+        """
+        Draws in blocks of block_draws per chain until the ESS/R-hat targets are met or draws
+        per chain are reached. Each block continues the chains from their last draw with the
+        step size and mass matrix adapted so far. The stopping reason is recorded in
+        idata.sample_stats.attrs["stopping_reason"].
+        """
+        model = self.model
+        nuts_step = steps[0]
+        block_seeds = np.random.default_rng(seed).integers(2**31, size=int(np.ceil(draws / block_draws)))
+        sample_kwargs = dict(return_inferencedata=True, chains = chains, cores = cores, step=steps,
+                             idata_kwargs={"log_likelihood": log_likelihood})
+        idata = pm.sample(min(block_draws, draws), tune=tune, random_seed=block_seeds[0], **sample_kwargs)
+        free_names = [rv.name for rv in model.free_RVs]
+        for block_seed in block_seeds[1:]:
+            met, reason = check_stopping_targets(idata, targets)
+            if met:
+                break
+            n_draws = idata.posterior.sizes["draw"]
+            last_points = [
+                {name: idata.posterior[name].isel(chain=chain, draw=-1).values for name in free_names}
+                for chain in range(idata.posterior.sizes["chain"])
+            ]
+            previous = _warm_start_step(nuts_step, extract_tuning(model, idata))
+            try:
+                block = pm.sample(min(block_draws, draws - n_draws), tune=0, initvals=last_points,
+                                  random_seed=block_seed, **sample_kwargs)
+            finally:
+                _set_step_state(nuts_step, *previous)
+            idata = az.concat(idata, block, dim="draw")
+        met, reason = check_stopping_targets(idata, targets)
+        n_draws = idata.posterior.sizes["draw"]
+        if met:
+            reason = f"targets met after {n_draws} draws per chain: {reason}"
+        else:
+            reason = f"draw limit of {draws} per chain reached before the targets: {reason}"
+        idata.sample_stats.attrs["stopping_reason"] = reason
+        print(f"ℹ️ Adaptive stopping: {reason}")
+        return idata
+
+    def fit(self, predictor, outcome, seed=42, draws=10000, tune=10000, stopping="fixed",
+            stopping_targets=None, block_draws=1000, predictive="pymc", loglik=None,
+            vi_method="advi", vi_iterations=20000, init_tuning=None, chains=4, cores=4,
+            target_accept=None, max_treedepth=None):
+        """
+        Samples the model on the given data with `chains` chains run on up to `cores` processes.
+        With stopping="fixed" it draws `draws` iterations per chain after `tune` tuning steps.
+        With stopping="ess" (pymc backend only) it draws in blocks of block_draws and stops as soon as
+        the ESS/R-hat targets (ESS_STOPPING_TARGETS, overridden by stopping_targets) are met,
+        with `draws` as the upper limit.
+        predictive="numpy" draws the posterior predictive with fast_posterior_predictive instead of
+        pm.sample_posterior_predictive.
+        loglik="grouped" stores one log likelihood column per unique (level, outcome) pattern and
+        computes WAIC, LOO and the BIC max-logp from that weighted form (see grouped_log_likelihood).
+        loglik=None picks "grouped" for the binomial likelihood and "pointwise" for the Bernoulli one.
+        With inference="vi" the model is fitted with vi_method for vi_iterations steps and `draws`
+        samples are taken from the approximation (one chain); tune and the stopping rule are unused.
+        init_tuning (a dict from extract_tuning or a path written by save_tuning) starts NUTS from a
+        previous run's step size and diagonal mass matrix (pymc backend only), so a much shorter
+        `tune` suffices for refits of the same configuration. The adapted tuning of a pymc-backend
+        NUTS run is stored in idata.sample_stats.attrs["tuning"].
+        target_accept and max_treedepth override the NUTS_SETTINGS of the parameterization, e.g. to
+        remove the divergences left by a hard posterior.
+        Returns model, idata, waic, loo, bic.
+        """
+        if stopping not in ("fixed", "ess"):
+            raise ValueError(f"Unknown stopping '{stopping}', expected 'fixed' or 'ess'.")
+        if predictive not in ("pymc", "numpy"):
+            raise ValueError(f"Unknown predictive '{predictive}', expected 'pymc' or 'numpy'.")
+        if loglik is None:
+            loglik = default_loglik(self.likelihood)
+        if loglik not in ("pointwise", "grouped"):
+            raise ValueError(f"Unknown loglik '{loglik}', expected 'pointwise' or 'grouped'.")
+        if stopping == "ess" and self.backend != "pymc":
+            raise ValueError("stopping='ess' is only supported with backend='pymc'.")
+        if stopping == "ess" and self.inference == "vi":
+            raise ValueError("stopping='ess' is only supported with inference='nuts'.")
+        if init_tuning is not None and (self.backend != "pymc" or self.inference != "nuts"):
+            raise ValueError("init_tuning is only supported with backend='pymc' and inference='nuts'.")
+
+        #--- Robust Reproducibility Setup ---
+        random.seed(seed)
+        np.random.seed(seed)
+        pytensor.config.on_opt_error = 'raise'
+
+        self.set_data(predictor, outcome)
+        n_obs = len(outcome)
+        target_accept = self.target_accept if target_accept is None else target_accept
+        max_treedepth = self.max_treedepth if max_treedepth is None else max_treedepth
+        model = self.model
+        # PyMC computes the per-observation log likelihood only for the pointwise Bernoulli fit
+        pointwise_log_likelihood = self.likelihood == "bernoulli" and loglik == "pointwise"
+        with model:
+            # Sampling - Request log_likelihood
+            if self.inference == "vi":
+                idata = fit_approximation(model, method=vi_method, n=vi_iterations, draws=draws, seed=seed)
+                if pointwise_log_likelihood:
+                    pm.compute_log_likelihood(idata, var_names=["y_obs"], progressbar=False)
+            else:
+                previous = None
+                if init_tuning is not None:
+                    previous = self._warm_start(self._steps(n_obs, target_accept, max_treedepth)[0], init_tuning)
+                try:
+                    if stopping == "ess":
+                        idata = self._sample_until_targets(self._steps(n_obs, target_accept, max_treedepth),
+                                                           seed, draws, tune, block_draws,
+                                                           stopping_targets, pointwise_log_likelihood,
+                                                           chains=chains, cores=cores)
+                    else:
+                        if self.backend == "pymc":
+                            sample_kwargs = {"step": self._steps(n_obs, target_accept, max_treedepth)}
+                        else:
+                            sample_kwargs = backend_sample_kwargs(self.backend, max_treedepth=max_treedepth,
+                                                                  cores=cores)
+                            sample_kwargs["target_accept"] = target_accept
+                        idata = pm.sample(
+                            draws,
+                            tune=tune,
+                            random_seed=seed,
+                            return_inferencedata=True,
+                            chains = chains,
+                            cores = cores,
+                            idata_kwargs={"log_likelihood": pointwise_log_likelihood},
+                            **sample_kwargs
+                        )
+                finally:
+                    if previous is not None:
+                        nuts_step = self._steps(n_obs, target_accept, max_treedepth)[0]
+                        _set_step_state(nuts_step, *previous)
+                if self.backend == "pymc":
+                    tuning = extract_tuning(model, idata)
+                    tuning["config"] = self._tuning_config()
+                    idata.sample_stats.attrs["tuning"] = json.dumps(
+                        {key: value.tolist() if isinstance(value, np.ndarray) else value
+                         for key, value in tuning.items()}
+                    )
+            if self.y_pred_in_model:
+                if predictive == "pymc":
+                    # Explicit var_names: without them PyMC appends to model.observed_RVs in place,
+                    # which corrupts the model for the next fit
+                    idata.extend(pm.sample_posterior_predictive(idata, var_names=["y_obs"]))
+            elif self.inference == "nuts":
+                # Keep the posterior to the same variables as PyMC's sampler (no transformed values)
+                transformed = [name for name in idata.posterior.data_vars if name.endswith("__")]
+                idata.posterior = idata.posterior.drop_vars(transformed)
+                if pointwise_log_likelihood and "log_likelihood" not in idata:
+                    # nutpie ignores idata_kwargs
+                    pm.compute_log_likelihood(idata, var_names=["y_obs"], progressbar=False)
+
+        predictive_vars = ["y_obs"] if "y_pred" in idata.posterior else ["y_obs", "y_pred"]
+        if predictive == "numpy":
+            fast_posterior_predictive(idata, likelihood=self.likelihood, var_names=predictive_vars, seed=seed)
+        elif not self.y_pred_in_model:
+            # y_pred goes on a copy so the reusable model stays free of discrete variables
+            with clone_model(model) as predictive_model:
+                _y_pred_rv(predictive_model, self.likelihood)
+                idata.extend(pm.sample_posterior_predictive(idata, var_names=predictive_vars))
+        n_params = len(model.free_RVs) if self.y_pred_in_model else len(model.free_RVs) + 1
+
+        if loglik == "grouped":
+            grouped_log_likelihood(idata, predictor, outcome)
+            waic = weighted_waic(idata)
+            loo = weighted_loo(idata)
+            weights = idata.constant_data["pattern_weight"].values
+        else:
+            if self.likelihood == "binomial":
+                # Per-respondent Bernoulli log likelihood, so WAIC/LOO/BIC match the Bernoulli fit
+                p_post = posterior_p(idata)
+                observed = xr.DataArray(np.asarray(outcome), dims="obs", coords={"obs": p_post["obs"]})
+                log_lik = xr.where(observed == 1, np.log(p_post), np.log1p(-p_post)).transpose("chain", "draw", "obs")
+                idata.add_groups(log_likelihood=xr.Dataset({"y_obs": log_lik}))
+            waic = az.waic(idata)
+            loo = az.loo(idata)
+            weights = 1
 
         # --- BIC calculation using highest posterior probability in the trace ---
-        n_params = len(model.free_RVs)
-        log_likelihood = idata.log_likelihood.y_obs.values  # shape: (chains, draws, obs)
-        summed_logps = log_likelihood.sum(axis=-1).flatten()
+        log_likelihood = idata.log_likelihood.y_obs.values  # shape: (chains, draws, obs or pattern)
+        summed_logps = (log_likelihood * weights).sum(axis=-1).flatten()
         max_logp = np.max(summed_logps)
-        bic = -2 * max_logp + n_params * np.log(n_obs)  
+        bic = -2 * max_logp + n_params * np.log(n_obs)
+
+        return model, idata, waic, loo, bic
+
+
+_REUSABLE_MODELS = {}
+
+
+def get_reusable_model(variant="B02", shape=4, likelihood="bernoulli", backend="pymc",
+                       parameterization="centered", p_storage=None, inference="nuts"):
+    """Returns the cached ReusableOrdinalModel for this configuration, building it on first use."""
+    if p_storage is None:
+        p_storage = default_p_storage(likelihood)
+    key = (variant, shape, likelihood, backend, parameterization, p_storage, inference)
+    if key not in _REUSABLE_MODELS:
+        _REUSABLE_MODELS[key] = ReusableOrdinalModel(variant=variant, shape=shape, likelihood=likelihood,
+                                                     backend=backend, parameterization=parameterization,
+                                                     p_storage=p_storage, inference=inference)
+    return _REUSABLE_MODELS[key]
+
+
+def ordinal_predictor_binary_outcome_model(predictor, outcome, variant="B02", seed = 42, shape = 4,
+                                           likelihood="bernoulli", backend="pymc", draws=10000, tune=10000,
+                                           stopping="fixed", stopping_targets=None, block_draws=1000,
+                                           parameterization="centered", p_storage=None, predictive="pymc",
+                                           loglik=None, inference="nuts", vi_method="advi",
+                                           vi_iterations=20000, init_tuning=None, chains=4, cores=4,
+                                           target_accept=None, max_treedepth=None):
+    """
+    PyMC model with a binary outcome and an ordinal predictor with a normal random walk constraint.
+    If variant=="B01", uses B01 priors else uses B02 with fluctuations around an estimated effect.
+    If likelihood=="binomial", the model is fitted on the per-level (successes, trials) counts
+    instead of one Bernoulli term per respondent, so the sampling cost does not grow with the
+    number of respondents. By default it also stores p per level and the grouped log likelihood,
+    which give the same WAIC, LOO and BIC as the per-respondent Bernoulli terms, so nothing stored
+    grows with the number of respondents either; p_storage="obs" or loglik="pointwise" ask for the
+    per-respondent forms explicitly.
+    backend selects the NUTS implementation, one of SAMPLER_BACKENDS (see backend_sample_kwargs).
+    The compiled model is cached per configuration and reused by later calls (see ReusableOrdinalModel).
+    stopping="ess" samples in blocks until the ESS/R-hat targets are met instead of a fixed number
+    of draws (see ReusableOrdinalModel.fit).
+    parameterization is "centered", "noncentered" or "auto" (see choose_parameterization) and sets
+    how the B02 intercept and level_effects_diff are sampled; the posterior of level_effects is the
+    same. target_accept and max_treedepth override the NUTS_SETTINGS of the parameterization.
+    p_storage="level" stores the per-level probabilities p_level (chains x draws x levels) instead of
+    the per-observation p; posterior_p(idata) expands them to p when needed. None (the default)
+    picks "level" for the binomial likelihood and "obs" for the Bernoulli one.
+    predictive="numpy" generates the posterior predictive directly from the draws (see
+    fast_posterior_predictive) instead of re-evaluating the PyMC graph.
+    loglik="grouped" stores the log likelihood once per unique (level, outcome) pattern with a
+    multiplicity weight; WAIC, LOO and BIC are computed from it (weighted_waic, weighted_loo).
+    None (the default) picks "grouped" for the binomial likelihood and "pointwise" otherwise.
+    inference="vi" replaces NUTS with a fast ADVI, full-rank ADVI or Pathfinder approximation
+    (vi_method) for exploratory runs; the outputs have the same variables, and
+    compare_approximation measures the distance to a NUTS fit of the same data.
+    init_tuning warm-starts NUTS from a saved step size and mass matrix (see save_tuning, load_tuning)
+    so refits of the same configuration can run with a much smaller `tune`.
+    chains and cores set the number of NUTS chains and the processes they run on (see sweep_b02 for
+    running several fits side by side under a total core budget).
+    Returns model, idata, waic, loo, bic.
+    """
+    if parameterization == "auto":
+        parameterization = choose_parameterization(predictor, outcome, shape) if variant != "B01" else "centered"
+    reusable_model = get_reusable_model(variant=variant, shape=shape, likelihood=likelihood, backend=backend,
+                                        parameterization=parameterization, p_storage=p_storage,
+                                        inference=inference)
+    return reusable_model.fit(predictor, outcome, seed=seed, draws=draws, tune=tune, stopping=stopping,
+                              stopping_targets=stopping_targets, block_draws=block_draws, predictive=predictive,
+                              loglik=loglik, vi_method=vi_method, vi_iterations=vi_iterations,
+                              init_tuning=init_tuning, chains=chains, cores=cores,
+                              target_accept=target_accept, max_treedepth=max_treedepth)
+
+
+def fit_cache_key(predictor, outcome, model_func, model_kwargs):
+    """
+    Content hash of a fit: the predictor/outcome arrays (values, dtype and shape), the source of
+    the file defining model_func (so any change to the model code gives a new key) and the
+    model kwargs. Returns a hex digest.
+    """
+    digest = hashlib.sha256()
+    for array in (predictor, outcome):
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype}{array.shape}".encode())
+        digest.update(array.tobytes())
+    source_file = model_func.__code__.co_filename
+    if os.path.exists(source_file):
+        with open(source_file, "rb") as f:
+            digest.update(f.read())
+    else:
+        digest.update(inspect.getsource(model_func).encode())
+    digest.update(json.dumps(model_kwargs, sort_keys=True, default=repr).encode())
+    return digest.hexdigest()
+
+
+class FitCache:
+    """
+    Content-addressed store of finished fits: {key}.nc holds the InferenceData and {key}.pkl the
+    WAIC, LOO and BIC, with keys from fit_cache_key. index.json records each entry's size and last
+    use. When the entries exceed max_bytes (or max_entries), the least recently used ones are
+    evicted. invalidate() drops one entry or, without a key, the whole cache.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024**3, max_entries=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "index.json")
+
+    def _read_index(self):
+        if not os.path.exists(self._index_path):
+            return {}
+        with open(self._index_path) as f:
+            return json.load(f)
+
+    def _write_index(self, index):
+        with open(self._index_path, "w") as f:
+            json.dump(index, f, indent=2)
+
+    def _paths(self, key):
+        return os.path.join(self.cache_dir, f"{key}.nc"), os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        """Returns the cached (idata, waic, loo, bic) for key, or None if it is not cached."""
+        index = self._read_index()
+        idata_path, metrics_path = self._paths(key)
+        if key not in index or not (os.path.exists(idata_path) and os.path.exists(metrics_path)):
+            return None
+        # Load eagerly so the cache file is not held open (it may be evicted or overwritten later)
+        with az.rc_context({"data.load": "eager"}):
+            idata = az.from_netcdf(idata_path)
+        with open(metrics_path, "rb") as f:
+            waic, loo, bic = pickle.load(f)
+        index[key]["last_used"] = time.time()
+        self._write_index(index)
+        return idata, waic, loo, bic
+
+    def put(self, key, idata, waic, loo, bic, description=None):
+        """Stores a fit under key and evicts old entries beyond the size bounds."""
+        idata_path, metrics_path = self._paths(key)
+        idata.to_netcdf(idata_path)
+        with open(metrics_path, "wb") as f:
+            pickle.dump((waic, loo, bic), f)
+        index = self._read_index()
+        index[key] = {"size": os.path.getsize(idata_path) + os.path.getsize(metrics_path),
+                      "last_used": time.time(), "description": description}
+        self._write_index(index)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until the cache is within max_bytes and max_entries."""
+        index = self._read_index()
+        total = sum(entry["size"] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]["last_used"]):
+            over_entries = self.max_entries is not None and len(index) > self.max_entries
+            if total <= self.max_bytes and not over_entries:
+                break
+            if key == keep:
+                continue
+            total -= index[key]["size"]
+            self._remove(key)
+            del index[key]
+        self._write_index(index)
+
+    def invalidate(self, key=None):
+        """Drops the entry for key, or every entry when key is None."""
+        index = self._read_index()
+        for k in ([key] if key is not None else list(index)):
+            self._remove(k)
+            index.pop(k, None)
+        self._write_index(index)
 
-    return model, idata, waic, loo, bic
+    def _remove(self, key):
+        for path in self._paths(key):
+            if os.path.exists(path):
+                os.remove(path)
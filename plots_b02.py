@@ -0,0 +1,212 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import numpy as np
+
+PLOT_KINDS = ("trace", "effect", "p", "ppc", "rank")
+PLOT_FORMATS = ("png", "svg", "none")
+PLOT_FILE_NAMES = {
+    "trace": "survey_trace_{label}",
+    "effect": "survey_posterior_effect_{label}",
+    "p": "survey_posterior_p_{label}",
+    "ppc": "survey_ppc_{label}",
+    "rank": "survey_rank_{label}",
+}
+
+
+def _flat_elements(posterior, var_names):
+    """
+    Yields (name, values) for every element of var_names, values shaped (chain, draw) and
+    name like "level_effects[2]" for elements of vector variables.
+    """
+    for var in var_names:
+        data = posterior[var]
+        extra_dims = [dim for dim in data.dims if dim not in ("chain", "draw")]
+        if not extra_dims:
+            yield var, data.values
+            continue
+        stacked = data.stack(element=extra_dims).transpose("chain", "draw", "element")
+        values = stacked.values
+        for i, coords in enumerate(stacked["element"].values):
+            coords = coords if isinstance(coords, tuple) else (coords,)
+            yield f"{var}[{', '.join(str(c) for c in coords)}]", values[:, :, i]
+
+
+def minmax_envelope(values, n_columns):
+    """
+    Bins the draws of each chain (values shaped (chain, draw)) into n_columns consecutive blocks
+    and returns the block centres and the per-block minimum and maximum, each shaped (chain, block).
+    Filling between them reproduces the pixels a full line plot of the trace would cover at
+    that width, while drawing only n_columns points per chain.
+    """
+    n_draws = values.shape[1]
+    starts = np.linspace(0, n_draws, min(n_columns, n_draws) + 1).astype(int)[:-1]
+    centres = (starts + np.append(starts[1:], n_draws) - 1) / 2
+    return centres, np.minimum.reduceat(values, starts, axis=1), np.maximum.reduceat(values, starts, axis=1)
+
+
+def plot_trace_downsampled(idata, var_names, n_columns=1000, kde_draws=4000):
+    """
+    Trace plot whose cost grows with the image width rather than the number of draws.
+    One row per variable: the left panel is a KDE per chain from at most kde_draws evenly thinned
+    draws, the right panel the min/max envelope of each chain over n_columns blocks of draws
+    (see minmax_envelope). Returns the matplotlib axes.
+    """
+    import arviz as az
+    import matplotlib.pyplot as plt
+
+    posterior = idata.posterior
+    n_chains, n_draws = posterior.sizes["chain"], posterior.sizes["draw"]
+    thin = max(1, int(np.ceil(n_chains * n_draws / kde_draws)))
+    colors = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+    _, axes = plt.subplots(len(var_names), 2, figsize=(12, 2 * len(var_names)), squeeze=False)
+    for row, var in enumerate(var_names):
+        density_ax, trace_ax = axes[row]
+        for _, values in _flat_elements(posterior, [var]):
+            centres, low, high = minmax_envelope(values, n_columns)
+            for chain in range(n_chains):
+                color = colors[chain % len(colors)]
+                az.plot_kde(values[chain, ::thin], ax=density_ax, plot_kwargs={"color": color, "linewidth": 1})
+                if n_draws <= n_columns:
+                    # one draw per block: the envelope has no width, draw the trace itself
+                    trace_ax.plot(centres, low[chain], color=color, alpha=0.7, linewidth=0.8)
+                else:
+                    # the edge line keeps narrow bands visible
+                    trace_ax.fill_between(centres, low[chain], high[chain], color=color, alpha=0.35, linewidth=0.5)
+        density_ax.set_title(var)
+        trace_ax.set_title(var)
+    return axes
+
+
+def plot_rank_binned(idata, var_names, bins=20):
+    """
+    Rank plot drawn from pre-binned ranks: the draws of all chains are ranked together and each
+    chain's ranks are counted into `bins` equal-width bins, so only bins bars per chain are drawn.
+    Chains are stacked vertically with the uniform expectation as a dashed line, like az.plot_rank.
+    Returns the matplotlib axes.
+    """
+    import matplotlib.pyplot as plt
+    from scipy.stats import rankdata
+
+    elements = list(_flat_elements(idata.posterior, var_names))
+    n_cols = min(3, len(elements))
+    n_rows = int(np.ceil(len(elements) / n_cols))
+    _, axes = plt.subplots(n_rows, n_cols, figsize=(4 * n_cols, 3 * n_rows), squeeze=False)
+    colors = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+    for ax, (name, values) in zip(axes.flat, elements):
+        n_chains = values.shape[0]
+        ranks = rankdata(values.ravel()).reshape(values.shape)
+        edges = np.linspace(0.5, values.size + 0.5, bins + 1)
+        expected = values.shape[1] / bins
+        width = edges[1] - edges[0]
+        for chain in range(n_chains):
+            counts, _ = np.histogram(ranks[chain], bins=edges)
+            offset = chain * expected * 1.5
+            ax.bar(edges[:-1], counts, width=width, bottom=offset, align="edge",
+                   color=colors[chain % len(colors)], alpha=0.8)
+            ax.axhline(offset + expected, color="k", linestyle="--", linewidth=0.8)
+        ax.set_yticks([chain * expected * 1.5 + expected / 2 for chain in range(n_chains)])
+        ax.set_yticklabels(range(n_chains))
+        ax.set_ylabel("Chain")
+        ax.set_xlabel("Rank (all chains)")
+        ax.set_title(name)
+    for ax in axes.flat[len(elements):]:
+        ax.set_visible(False)
+    return axes
+
+
+def _use_headless_backend():
+    """
+    Pool initializer: switches the worker's matplotlib to the non-interactive Agg backend (no GUI,
+    faster rendering). Never called in the caller's process, whose backend is left as it is.
+    """
+    matplotlib.use("Agg", force=True)
+
+
+def _render_plot(kind, idata_path, p_subset, var_names, path, dpi, downsample=False):
+    """
+    Renders one plot to path. The posterior is read from the idata file written by
+    run_and_summarize, so worker processes share it without it being pickled to each of them.
+    Only the figures it creates are closed, so a notebook session rendering in-process keeps its own.
+    Returns (kind, path, error) with error None on success.
+    """
+    import arviz as az
+    import matplotlib.pyplot as plt
+
+    open_figures = set(plt.get_fignums())
+    try:
+        if kind == "p":
+            az.plot_posterior(p_subset)
+        else:
+            with az.rc_context({"data.load": "eager"}):
+                idata = az.from_netcdf(idata_path)
+            if kind == "trace" and downsample:
+                # one envelope block per pixel column of the trace panel (right half of the figure)
+                plot_trace_downsampled(idata, var_names, n_columns=int(6 * dpi))
+            elif kind == "trace":
+                az.plot_trace(idata, var_names=var_names)
+            elif kind == "effect":
+                az.plot_posterior(idata, var_names=["effect"])
+            elif kind == "ppc":
+                az.plot_ppc(idata)
+            elif kind == "rank" and downsample:
+                plot_rank_binned(idata, var_names)
+            elif kind == "rank":
+                az.plot_rank(idata, var_names=var_names)
+        plt.tight_layout()
+        plt.savefig(path, dpi=dpi)
+        return kind, path, None
+    except Exception as e:
+        return kind, path, e
+    finally:
+        for number in set(plt.get_fignums()) - open_figures:
+            plt.close(number)
+
+
+def render_plots(idata_path, label, output_dir, plots=PLOT_KINDS, var_names=None, p_subset=None,
+                 dpi=300, fmt="png", max_workers=None, downsample=False):
+    """
+    Renders the run_and_summarize plots of the idata saved at idata_path.
+    plots selects which of PLOT_KINDS to draw ("effect" and "p" are skipped when their input is
+    missing: no 'effect' in the posterior, or p_subset is None). var_names are the trace/rank
+    variables and p_subset a small Dataset of the sampled observations' p.
+    fmt is "png", "svg" or "none" (no plots). With more than one worker the plots are drawn
+    concurrently in worker processes with the headless Agg backend; max_workers=1 draws them in
+    this process with its current backend, which avoids the worker start-up cost for quick runs.
+    downsample=True draws the trace and rank plots from min/max envelopes and pre-binned ranks
+    (plot_trace_downsampled, plot_rank_binned), for long chains.
+    Returns a dict kind -> path of the plots written.
+    """
+    if fmt not in PLOT_FORMATS:
+        raise ValueError(f"Unknown plot format '{fmt}', expected one of {PLOT_FORMATS}.")
+    unknown = set(plots) - set(PLOT_KINDS)
+    if unknown:
+        raise ValueError(f"Unknown plots {sorted(unknown)}, expected some of {PLOT_KINDS}.")
+    if fmt == "none":
+        return {}
+
+    jobs = []
+    for kind in PLOT_KINDS:
+        if kind not in plots or (kind in ("trace", "rank") and not var_names) or (kind == "p" and p_subset is None):
+            continue
+        if kind == "effect" and "effect" not in (var_names or []):
+            continue
+        path = os.path.join(output_dir, PLOT_FILE_NAMES[kind].format(label=label) + f".{fmt}")
+        jobs.append((kind, idata_path, p_subset if kind == "p" else None, var_names, path, dpi, downsample))
+
+    if max_workers is None:
+        max_workers = min(len(jobs), os.cpu_count() or 1)
+    if max_workers <= 1:
+        results = [_render_plot(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_use_headless_backend) as pool:
+            results = list(pool.map(_render_plot, *zip(*jobs)))
+
+    written = {}
+    for kind, path, error in results:
+        if error is None:
+            written[kind] = path
+        else:
+            print(f"⚠️ Failed to create {kind} plot: {error}")
+    return written
@@ -1,17 +1,7 @@
 #Import Libraries
 import pandas as pd
 import numpy as np
-
-#Import data
-file = "2023-11-14-survey-data-a-szervezeti-kommunikacio-jelentosege-a-munkaero-megtartasaban(1).xlsx"
-data = pd.read_excel(file, sheet_name = "Data")
-data.head()
-data.info()
-
-# Rename columns to C999 format
-new_columns = {old_col: f'C{i:03d}' for i, old_col in enumerate(data.columns)}
-data = data.rename(columns=new_columns)
-data.head()
+from survey_data import load_survey_data, encode_likert, likert_medians
 
 # These are ordered to match the English questions list below.
 PASTEX_COLUMN_NAMES = [
@@ -35,6 +25,12 @@ QUESTIONS_ENGLISH_TRANSLATIONS = [
     "(g) honest and respectful communication between supervisors and subordinates, as well as among colleagues",
 ]
 
+#Import data (Parquet cache of the Excel sheet with the C999 column IDs, PastEx columns only)
+file = "2023-11-14-survey-data-a-szervezeti-kommunikacio-jelentosege-a-munkaero-megtartasaban(1).xlsx"
+data = load_survey_data(file, sheet_name="Data", columns=PASTEX_COLUMN_NAMES)
+data.head()
+data.info()
+
 #Find the unique values of each PastEx Varible observed
 print("--- Unique Values for PastEx Variables ---")
 for col_id in PASTEX_COLUMN_NAMES:
@@ -45,21 +41,13 @@ for col_id in PASTEX_COLUMN_NAMES:
     else:
         print(f"\nWarning: PastEx Column ID '{col_id}' not found in the DataFrame after renaming.")
 
-# Prepare a list to store the calculated medians
-medians = []
-
-# Calculate medians for each PastEx column after applying Likert mapping
+# Calculate medians for all PastEx columns at once from the encoded Likert answers
+# (unmapped text and empty cells are left out, columns missing from the data give NaN)
+present_columns = [col_id for col_id in PASTEX_COLUMN_NAMES if col_id in data.columns]
 for col_id in PASTEX_COLUMN_NAMES:
-    if col_id in data.columns:
-        # Apply the Likert mapping and drop any NaN values that result from unmapped text
-        numeric_data = data[col_id].map(LIKERT_MAPPING).dropna()
-        if not numeric_data.empty:
-            medians.append(numeric_data.median())
-        else:
-            medians.append(np.nan) # Append NaN if no valid numeric data
-    else:
+    if col_id not in data.columns:
         print(f"Warning: Column ID '{col_id}' not found in the DataFrame after renaming. Skipping.")
-        medians.append(np.nan) # Append NaN if column is missing
+medians = likert_medians(encode_likert(data, present_columns, LIKERT_MAPPING)).reindex(PASTEX_COLUMN_NAMES).tolist()
 
 # Output Markdown table
 print('| Question | Median |')
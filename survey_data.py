@@ -0,0 +1,509 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SURVEY_FILE = "2023-11-14-survey-data-a-szervezeti-kommunikacio-jelentosege-a-munkaero-megtartasaban(1).xlsx"
+
+
+def c_id_columns(columns):
+    """Maps the original survey column names to the C999 IDs used by the scripts (C000, C001, ...)."""
+    return {old_col: f'C{i:03d}' for i, old_col in enumerate(columns)}
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """SHA-256 of the file contents, so a re-exported survey file invalidates the cache."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_paths(file, sheet_name, cache_dir):
+    cache_dir = cache_dir if cache_dir is not None else os.path.join(os.path.dirname(os.path.abspath(file)),
+                                                                     ".survey_cache")
+    stem = f"{os.path.splitext(os.path.basename(file))[0]}-{sheet_name}"
+    return os.path.join(cache_dir, f"{stem}.parquet"), os.path.join(cache_dir, f"{stem}.json")
+
+
+def _parquet_safe(data):
+    """Casts object columns holding mixed types (e.g. numbers and text) to strings, which Parquet requires."""
+    for col in data.columns:
+        if data[col].dtype == object:
+            types = {type(value) for value in data[col].dropna()}
+            if len(types) > 1:
+                data[col] = data[col].where(data[col].isna(), data[col].astype(str))
+    return data
+
+
+def read_survey_columns(file=SURVEY_FILE, c_ids=(), sheet_name="Data"):
+    """
+    Streams the sheet row by row in openpyxl's read-only mode and keeps only the cells of the
+    requested C-IDs (C-ID i is the i-th column), so memory grows with the columns asked for
+    rather than with the whole sheet of free-text answers. Each column is built once at the end
+    with the dtype pandas infers for it (int, float, datetime or object), like pd.read_excel.
+    Trailing empty rows are dropped, as pd.read_excel does.
+    Returns (data, header) with data a pandas DataFrame with the C-ID columns and header the
+    original names of all the sheet's columns.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = list(next(rows))
+        positions = [int(c_id[1:]) for c_id in c_ids]
+        for c_id, position in zip(c_ids, positions):
+            if position >= len(header):
+                raise KeyError(f"Column '{c_id}' not in sheet '{sheet_name}' ({len(header)} columns).")
+        values = [[] for _ in positions]
+        n_rows = 0
+        if positions:
+            for i, row in enumerate(rows):
+                for column, position in zip(values, positions):
+                    column.append(row[position] if position < len(row) else None)
+                if any(value is not None for value in row):
+                    n_rows = i + 1
+    finally:
+        workbook.close()
+    data = pd.DataFrame({c_id: pd.Series(column[:n_rows]) for c_id, column in zip(c_ids, values)})
+    return data, header
+
+
+def build_survey_cache(file=SURVEY_FILE, sheet_name="Data", cache_dir=None, columns=None, extend=False):
+    """
+    Converts the survey Excel sheet to a Parquet file with the C999 column IDs applied, plus a
+    JSON sidecar with the source fingerprint, the C-ID -> original question mapping and the
+    C-IDs stored. With columns=None the whole sheet is parsed with pd.read_excel; otherwise
+    only those columns are streamed (read_survey_columns) and, with extend=True, added to the
+    columns already in the cache.
+    Returns the path of the Parquet file.
+    """
+    parquet_path, meta_path = _cache_paths(file, sheet_name, cache_dir)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    if columns is None:
+        data = pd.read_excel(file, sheet_name=sheet_name)
+        header = list(data.columns)
+        data = data.rename(columns=c_id_columns(data.columns))
+    else:
+        data, header = read_survey_columns(file, list(columns), sheet_name=sheet_name)
+        if extend:
+            data = pd.concat([pd.read_parquet(parquet_path, engine="pyarrow"), data], axis=1)
+            data = data[sorted(data.columns)]
+    data = _parquet_safe(data)
+    data.to_parquet(parquet_path, engine="pyarrow", index=False)
+    stat = os.stat(file)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(file), "sheet_name": sheet_name, "fingerprint": file_fingerprint(file),
+                   "size": stat.st_size, "mtime": stat.st_mtime, "cached_columns": list(data.columns),
+                   "columns": {f'C{i:03d}': str(old_col) for i, old_col in enumerate(header)}},
+                  f, indent=2, ensure_ascii=False)
+    return parquet_path
+
+
+def survey_question_names(file=SURVEY_FILE, sheet_name="Data", cache_dir=None):
+    """Returns the C-ID -> original question mapping stored with the cache (building it if needed)."""
+    load_survey_data(file, sheet_name=sheet_name, columns=[], cache_dir=cache_dir)
+    with open(_cache_paths(file, sheet_name, cache_dir)[1], encoding="utf-8") as f:
+        return json.load(f)["columns"]
+
+
+def _cached_meta(file, sheet_name, cache_dir):
+    """Returns the sidecar of an up-to-date cache of the sheet, or None when it is missing or stale."""
+    parquet_path, meta_path = _cache_paths(file, sheet_name, cache_dir)
+    if not (os.path.exists(parquet_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    # Unchanged size and modification time: trust the cache without hashing the file again
+    stat = os.stat(file)
+    if (meta["size"], meta["mtime"]) != (stat.st_size, stat.st_mtime):
+        if meta["fingerprint"] != file_fingerprint(file):
+            return None
+        meta["size"], meta["mtime"] = stat.st_size, stat.st_mtime
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+    return meta
+
+
+def load_survey_data(file=SURVEY_FILE, sheet_name="Data", columns=None, cache_dir=None, refresh=False):
+    """
+    Loads the survey sheet with the columns already renamed to C999 IDs.
+    The Excel file is parsed once and stored as Parquet (build_survey_cache); later calls
+    memory-map the Parquet file and read only `columns` (default: all). When `columns` is given
+    and not cached yet, only those columns are streamed from the Excel file and added to the
+    cache (read_survey_columns), so a cold cache does not parse the whole sheet. The cache is
+    rebuilt when the Excel file's contents change (SHA-256, checked when its size or modification
+    time differs from the cached one), or when refresh=True.
+    Returns a pandas DataFrame.
+    """
+    parquet_path, _ = _cache_paths(file, sheet_name, cache_dir)
+    meta = None if refresh else _cached_meta(file, sheet_name, cache_dir)
+    if meta is None:
+        print(f"ℹ️ Building the Parquet cache of '{file}' ({sheet_name}).")
+        build_survey_cache(file, sheet_name=sheet_name, cache_dir=cache_dir, columns=columns)
+    elif columns is None and len(meta["cached_columns"]) < len(meta["columns"]):
+        build_survey_cache(file, sheet_name=sheet_name, cache_dir=cache_dir)
+    elif columns is not None:
+        missing = [c_id for c_id in columns if c_id not in meta["cached_columns"]]
+        if missing:
+            build_survey_cache(file, sheet_name=sheet_name, cache_dir=cache_dir, columns=missing, extend=True)
+    return pd.read_parquet(parquet_path, engine="pyarrow", columns=columns, memory_map=True)
+
+
+# Code of missing or unmapped answers in the encoded response matrix
+MISSING_CODE = -1
+
+
+def encode_likert(data, columns, mapping, missing=MISSING_CODE):
+    """
+    Encodes the Likert answers of `columns` into a respondents x items int8 matrix in one pass:
+    the answers of all columns are factorized together, `mapping` (answer text -> code) is looked
+    up once per distinct answer, and the codes are gathered back for every cell. Empty cells and
+    answers not in mapping get the `missing` code.
+    Returns a pandas DataFrame of dtype int8 with data's index and the given columns.
+    """
+    values = data[list(columns)].to_numpy(dtype=object)
+    inverse, distinct = pd.factorize(values.ravel())
+    # the last entry serves factorize's -1 (empty cell)
+    lookup = np.array([mapping.get(answer, missing) for answer in distinct] + [missing], dtype=np.int8)
+    codes = lookup[inverse].reshape(values.shape)
+    return pd.DataFrame(codes, index=data.index, columns=list(columns))
+
+
+# Paired PastEx/PresentEx items (B04_Report.md, O3): merged predictor label, PastEx C-ID, PresentEx C-ID
+TRAIT_PAIRS = pd.DataFrame([
+    ("I_I", "C027", "C079"),
+    ("a", "C034", "C086"),
+    ("b", "C035", "C087"),
+    ("c", "C036", "C088"),
+    ("d", "C037", "C089"),
+    ("e", "C038", "C090"),
+    ("f", "C039", "C091"),
+    ("g", "C040", "C092"),
+], columns=["label", "pastex", "presentex"])
+
+
+def coalesce_trait_pairs(data, mapping, pairs=TRAIT_PAIRS, missing=MISSING_CODE):
+    """
+    Builds every merged PastEx/PresentEx predictor at once: all columns of the pair table are
+    encoded together (encode_likert) and each pair takes the PastEx code where it is answered,
+    otherwise the PresentEx code (respondents answer one of the two, depending on the outcome).
+    Returns an int8 DataFrame with data's index and one column per pair label, `missing` where
+    neither answer is usable.
+    """
+    columns = list(dict.fromkeys(pairs["pastex"].tolist() + pairs["presentex"].tolist()))
+    position = {c_id: i for i, c_id in enumerate(columns)}
+    codes = encode_likert(data, columns, mapping, missing=missing).to_numpy()
+    past = codes[:, [position[c_id] for c_id in pairs["pastex"]]]
+    present = codes[:, [position[c_id] for c_id in pairs["presentex"]]]
+    return pd.DataFrame(np.where(past != missing, past, present), index=data.index,
+                        columns=pairs["label"].tolist())
+
+
+def likert_counts(codes, missing=MISSING_CODE):
+    """
+    Per-item answer histograms of an encoded response matrix, from one np.bincount over all
+    items: row i counts how often item i got code 0, 1, ..., max code. `missing` is not counted.
+    Returns a pandas DataFrame with one row per item and one column per code.
+    """
+    values = codes.to_numpy()
+    n_codes = int(values.max()) + 1 if values.size and values.max() >= 0 else 1
+    items = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+    valid = values != missing
+    counts = np.bincount(items[valid] * n_codes + values[valid], minlength=values.shape[1] * n_codes)
+    return pd.DataFrame(counts.reshape(values.shape[1], n_codes), index=codes.columns)
+
+
+def likert_quantiles(codes, q=0.5, missing=MISSING_CODE):
+    """
+    Exact quantile q of every item of an encoded response matrix, read off the per-item
+    histograms (likert_counts) instead of sorting the answers. Uses the same linear
+    interpolation between the two neighbouring order statistics as Series.quantile (and
+    Series.median for q=0.5), so an even count can give a half-way value. NaN for empty items.
+    Returns a pandas Series indexed by item.
+    """
+    return quantiles_from_counts(likert_counts(codes, missing=missing), q=q)
+
+
+def quantiles_from_counts(counts, q=0.5):
+    """
+    Exact quantile q per row of a histogram table (items x codes, as from likert_counts or
+    SurveyStatsStore.item_counts); see likert_quantiles. Returns a pandas Series indexed by item.
+    """
+    cumulative = counts.to_numpy().cumsum(axis=1)
+    n_answers = cumulative[:, -1]
+    position = (n_answers - 1) * q
+    lower, upper = np.floor(position), np.ceil(position)
+    # the code at sorted position k is the number of codes whose cumulative count is <= k
+    lower_code = (cumulative <= lower[:, None]).sum(axis=1)
+    upper_code = (cumulative <= upper[:, None]).sum(axis=1)
+    quantiles = lower_code + (position - lower) * (upper_code - lower_code)
+    return pd.Series(np.where(n_answers > 0, quantiles, np.nan), index=counts.index)
+
+
+def likert_medians(codes, missing=MISSING_CODE):
+    """Median code of every item of an encoded response matrix, ignoring `missing`; NaN for empty items."""
+    return likert_quantiles(codes, q=0.5, missing=missing)
+
+
+def format_likert_median(median, labels):
+    """
+    Text form of a median code: its label, 'Between "X" and "Y"' for a half-way median, or
+    "N/A" for NaN. labels maps codes to answer texts (e.g. LIKERT_ENGLISH).
+    """
+    if pd.isna(median):
+        return "N/A"
+    if float(median).is_integer():
+        return labels[int(median)]
+    return f'Between "{labels[int(np.floor(median))]}" and "{labels[int(np.ceil(median))]}"'
+
+
+def outcome_counts(codes, outcome, missing=MISSING_CODE, n_codes=None):
+    """
+    Level x outcome counts of every item of an encoded response matrix against a binary outcome,
+    from one np.bincount over (item, level, outcome value) keys. Respondents with a `missing`
+    answer or an outcome other than 0/1 are not counted for that item.
+    Returns an int64 array shaped (items, n_codes, 2), n_codes defaulting to the largest code + 1.
+    """
+    values = codes.to_numpy()
+    if n_codes is None:
+        n_codes = int(values.max()) + 1 if values.size and values.max() >= 0 else 1
+    outcome = np.asarray(outcome, dtype=float)
+    known = np.isin(outcome, (0, 1))
+    outcome = np.broadcast_to(np.where(known, outcome, 0).astype(np.int64)[:, None], values.shape)
+    item_index = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+    valid = (values != missing) & known[:, None]
+    keys = (item_index[valid] * n_codes + values[valid]) * 2 + outcome[valid]
+    return np.bincount(keys, minlength=values.shape[1] * n_codes * 2).reshape(values.shape[1], n_codes, 2)
+
+
+def contingency_log_odds(codes, outcome, missing=MISSING_CODE, levels=None):
+    """
+    Level x outcome contingency tables and log odds of every item against a binary outcome in
+    one pass (outcome_counts). The log odds of a level is log(count of 1 / count of 0), NaN when
+    either count is zero.
+    levels selects the Likert levels to report (default: every code from 1 to the largest).
+    Returns (table, stacked): table is a tidy DataFrame with one row per (c_id, level) and the
+    columns count_0, count_1 and log_odds; stacked is an (items, levels, 3) array of
+    count_0, count_1 and log_odds in the same order.
+    """
+    counts = outcome_counts(codes, outcome, missing=missing)
+    levels = np.arange(1, counts.shape[1]) if levels is None else np.asarray(levels)
+    counts = np.pad(counts, ((0, 0), (0, max(0, levels.max() + 1 - counts.shape[1])), (0, 0)))[:, levels]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_odds = np.where((counts > 0).all(axis=-1), np.log(counts[..., 1] / counts[..., 0]), np.nan)
+    stacked = np.concatenate([counts.astype(float), log_odds[..., None]], axis=-1)
+    table = pd.DataFrame({
+        "c_id": np.repeat(np.asarray(codes.columns), len(levels)),
+        "level": np.tile(levels, codes.shape[1]),
+        "count_0": counts[..., 0].ravel(),
+        "count_1": counts[..., 1].ravel(),
+        "log_odds": log_odds.ravel(),
+    })
+    return table, stacked
+
+
+# Store shared by the scripts (milestone_b03, workplace_trait_medians), next to the other results
+SURVEY_STATS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "survey_stats")
+
+
+class SurveyStatsStore:
+    """
+    Persistent, mergeable sufficient statistics of one or more survey waves, kept in store_dir:
+    item_counts.parquet holds the per-item Likert histograms (wave, c_id, code, count) and
+    pair_counts.parquet the per-(level, outcome) counts of each item against a binary outcome
+    (wave, c_id, outcome, level, value, count). add_wave replaces only the rows of its own wave,
+    and the queries sum the requested waves, so the medians, contingency tables and binomial
+    model data never need the raw rows again.
+    """
+
+    ITEM_COLUMNS = ["wave", "c_id", "code", "count"]
+    PAIR_COLUMNS = ["wave", "c_id", "outcome", "level", "value", "count"]
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        self._item_path = os.path.join(store_dir, "item_counts.parquet")
+        self._pair_path = os.path.join(store_dir, "pair_counts.parquet")
+
+    def _read(self, path, columns):
+        if not os.path.exists(path):
+            return pd.DataFrame({column: pd.Series(dtype=object if column in ("wave", "c_id", "outcome")
+                                                   else np.int64) for column in columns})
+        return pd.read_parquet(path, engine="pyarrow")
+
+    def waves(self):
+        """Returns the waves in the store."""
+        return sorted(self._read(self._item_path, self.ITEM_COLUMNS)["wave"].unique().tolist())
+
+    @staticmethod
+    def wave_statistics(codes, outcomes=None, missing=MISSING_CODE):
+        """
+        The statistics of a block of respondents, as (item_counts, pair_counts) tables with the
+        columns of the store without "wave". codes is an encoded response matrix (encode_likert),
+        one column per C-ID; outcomes optionally maps outcome names to Series aligned with codes,
+        counted per (level, outcome value) of every item where the outcome is 0 or 1.
+        The counts of several blocks add up (see merge_statistics).
+        """
+        counts = likert_counts(codes, missing=missing)
+        items = counts.stack().rename("count").reset_index()
+        items.columns = ["c_id", "code", "count"]
+        items = items[items["count"] > 0]
+
+        pairs = []
+        for name, outcome in (outcomes or {}).items():
+            pair_counts = outcome_counts(codes, outcome, missing=missing, n_codes=counts.shape[1]).ravel()
+            item, level, value = np.unravel_index(np.arange(pair_counts.size), (codes.shape[1], counts.shape[1], 2))
+            nonzero = pair_counts > 0
+            pairs.append(pd.DataFrame({"c_id": np.asarray(codes.columns)[item[nonzero]], "outcome": name,
+                                       "level": level[nonzero], "value": value[nonzero],
+                                       "count": pair_counts[nonzero]}))
+        if not pairs:
+            return items, pd.DataFrame({column: pd.Series(dtype=object if column in ("c_id", "outcome") else np.int64)
+                                        for column in SurveyStatsStore.PAIR_COLUMNS[1:]})
+        return items, pd.concat(pairs, ignore_index=True)
+
+    @staticmethod
+    def merge_statistics(*statistics):
+        """Adds up (item_counts, pair_counts) tables of several blocks of respondents."""
+        items = pd.concat([block[0] for block in statistics], ignore_index=True)
+        pairs = pd.concat([block[1] for block in statistics], ignore_index=True)
+        items = items.groupby(["c_id", "code"], as_index=False)["count"].sum()
+        pairs = pairs.groupby(["c_id", "outcome", "level", "value"], as_index=False)["count"].sum()
+        return items, pairs
+
+    def add_wave(self, wave, codes, outcomes=None, missing=MISSING_CODE, c_ids=None):
+        """
+        Stores the statistics of one wave (see wave_statistics), replacing any earlier version
+        of that wave's items, so every call rebuilds them from the current data and mapping.
+        Items of the wave not in codes are kept, so scripts storing different items of the same
+        wave can share one store. codes may instead be an (item_counts, pair_counts) pair already
+        computed, e.g. accumulated chunk by chunk by ingest_survey_stream; c_ids then names the
+        items it covers (default: the items in the tables).
+        """
+        if isinstance(codes, tuple):
+            items, pairs = codes
+            if c_ids is None:
+                c_ids = set(items["c_id"]) | set(pairs["c_id"])
+        else:
+            items, pairs = self.wave_statistics(codes, outcomes, missing)
+            c_ids = codes.columns if c_ids is None else c_ids
+        for path, columns, new_rows in ((self._item_path, self.ITEM_COLUMNS, items),
+                                        (self._pair_path, self.PAIR_COLUMNS, pairs)):
+            stored = self._read(path, columns)
+            stored = stored[(stored["wave"] != str(wave)) | ~stored["c_id"].isin(list(c_ids))]
+            new_rows = new_rows.assign(wave=str(wave))[columns]
+            pd.concat([stored, new_rows], ignore_index=True).astype({"count": np.int64}).to_parquet(
+                path, engine="pyarrow", index=False)
+
+    def remove_wave(self, wave):
+        """Drops every statistic of a wave."""
+        for path, columns in ((self._item_path, self.ITEM_COLUMNS), (self._pair_path, self.PAIR_COLUMNS)):
+            stored = self._read(path, columns)
+            stored[stored["wave"] != str(wave)].to_parquet(path, engine="pyarrow", index=False)
+
+    def _select(self, table, c_ids, waves):
+        table = table[table["c_id"].isin(list(c_ids))]
+        if waves is not None:
+            table = table[table["wave"].isin([str(wave) for wave in waves])]
+        return table
+
+    def item_counts(self, c_ids, waves=None):
+        """
+        Likert histograms of c_ids summed over waves (default: all), items x codes in the
+        layout of likert_counts; feed it to quantiles_from_counts for medians.
+        """
+        table = self._select(self._read(self._item_path, self.ITEM_COLUMNS), c_ids, waves)
+        counts = table.pivot_table(index="c_id", columns="code", values="count", aggfunc="sum", fill_value=0)
+        counts = counts.reindex(index=list(c_ids), fill_value=0)
+        return counts.reindex(columns=range(int(counts.columns.max()) + 1 if len(counts.columns) else 1),
+                              fill_value=0)
+
+    def contingency_table(self, c_id, outcome, waves=None):
+        """Counts of level x outcome value (0, 1) of one item, summed over waves (default: all)."""
+        table = self._select(self._read(self._pair_path, self.PAIR_COLUMNS), [c_id], waves)
+        table = table[table["outcome"] == outcome]
+        return table.pivot_table(index="level", columns="value", values="count", aggfunc="sum",
+                                 fill_value=0).reindex(columns=[0, 1], fill_value=0)
+
+    def model_data(self, c_id, outcome, waves=None):
+        """
+        The predictor/outcome table of the B02 model rebuilt from the stored counts. Rows are
+        exchangeable given (level, outcome), so a fit on it (e.g. likelihood="binomial", which
+        only uses the per-level counts) is the same as a fit on the raw rows.
+        Returns a pandas DataFrame with the columns "predictor" and "outcome".
+        """
+        table = self.contingency_table(c_id, outcome, waves=waves).stack().rename("count").reset_index()
+        return pd.DataFrame({
+            "predictor": np.repeat(table["level"].to_numpy(), table["count"].to_numpy()),
+            "outcome": np.repeat(table["value"].to_numpy(), table["count"].to_numpy()),
+        })
+
+
+def iter_survey_chunks(file=SURVEY_FILE, c_ids=(), sheet_name="Data", chunksize=100_000):
+    """
+    Yields the survey rows in DataFrames of at most chunksize rows, holding only the requested
+    C-ID columns, so exports larger than memory can be processed. CSV files are read with
+    pd.read_csv(usecols=..., chunksize=...); xlsx files are streamed in openpyxl's read-only mode.
+    Rows that are empty in every column are skipped.
+    """
+    c_ids = list(c_ids)
+    positions = [int(c_id[1:]) for c_id in c_ids]
+    if os.path.splitext(file)[1].lower() == ".csv":
+        header = list(pd.read_csv(file, nrows=0).columns)
+        names = {header[position]: c_id for position, c_id in zip(positions, c_ids)}
+        for chunk in pd.read_csv(file, usecols=sorted(set(positions)), chunksize=chunksize):
+            yield chunk.rename(columns=names)[c_ids]
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        next(rows)  # header
+        values = [[] for _ in positions]
+        for row in rows:
+            if not any(value is not None for value in row):
+                continue
+            for column, position in zip(values, positions):
+                column.append(row[position] if position < len(row) else None)
+            if len(values[0]) >= chunksize:
+                yield pd.DataFrame({c_id: pd.Series(column) for c_id, column in zip(c_ids, values)})
+                values = [[] for _ in positions]
+        if values and values[0]:
+            yield pd.DataFrame({c_id: pd.Series(column) for c_id, column in zip(c_ids, values)})
+    finally:
+        workbook.close()
+
+
+def ingest_survey_stream(file, store, wave, likert_columns, mapping, outcomes=None, sheet_name="Data",
+                         chunksize=100_000, missing=MISSING_CODE):
+    """
+    Chunked ingestion of a survey export into a SurveyStatsStore in bounded memory.
+    Each chunk of rows (iter_survey_chunks) is encoded (encode_likert) and reduced to its
+    Likert histograms and (level, outcome) counts (SurveyStatsStore.wave_statistics), which are
+    added to the running totals; only those totals, not the rows, are kept. outcomes maps
+    outcome names to (c_id, function) pairs, the function turning that column of a chunk into
+    0/1 values, e.g. {"outcome_binary": ("C004", lambda answers: (answers == "Igen").astype(int))}.
+    The totals are stored as `wave` at the end, so the medians, contingency tables and model data
+    read from the store are the same as with the in-memory path.
+    Returns the number of rows ingested.
+    """
+    outcomes = outcomes or {}
+    columns = list(dict.fromkeys(list(likert_columns) + [c_id for c_id, _ in outcomes.values()]))
+    totals, n_rows = None, 0
+    for chunk in iter_survey_chunks(file, columns, sheet_name=sheet_name, chunksize=chunksize):
+        codes = encode_likert(chunk, likert_columns, mapping, missing=missing)
+        chunk_outcomes = {name: function(chunk[c_id]) for name, (c_id, function) in outcomes.items()}
+        statistics = SurveyStatsStore.wave_statistics(codes, chunk_outcomes, missing=missing)
+        totals = statistics if totals is None else SurveyStatsStore.merge_statistics(totals, statistics)
+        n_rows += len(chunk)
+    if totals is None:
+        totals = SurveyStatsStore.wave_statistics(pd.DataFrame(columns=list(likert_columns), dtype=np.int8))
+    store.add_wave(wave, totals, c_ids=likert_columns)
+    return n_rows
@@ -0,0 +1,172 @@
+import argparse
+import importlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from threadpoolctl import threadpool_limits
+
+from model_B02 import ordinal_predictor_binary_outcome_model, save_model_metrics, save_tuning
+
+
+def expand_grid(grid):
+    """
+    Turns a sweep grid into a list of model_kwargs dicts.
+    grid is either a dict of lists (every combination is run, e.g. {"variant": ["B01", "B02"],
+    "shape": [3, 4], "seed": [1, 2]}) or a list of model_kwargs dicts (run as given).
+    """
+    if isinstance(grid, dict):
+        keys = list(grid)
+        values = [value if isinstance(value, (list, tuple)) else [value] for value in grid.values()]
+        return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+    return [dict(model_kwargs) for model_kwargs in grid]
+
+
+def run_label(model_kwargs, prefix="sweep"):
+    """Builds a file-name-safe label such as "sweep_variant-b02_shape-3_seed-1" from model_kwargs."""
+    parts = [f"{key}-{value}".lower().replace(" ", "").replace(os.sep, "") for key, value in model_kwargs.items()]
+    return "_".join([prefix] + parts)
+
+
+def plan_cores(n_runs, total_cores, chains=4):
+    """
+    Splits total_cores between concurrent fits.
+    Each fit runs its `chains` chains on cores_per_fit processes (at most one per chain), and
+    n_workers fits run at the same time, so n_workers * cores_per_fit never exceeds total_cores.
+    cores_per_fit minimizes the sweep's length in chain-lengths (waves of fits times the chains
+    each of a fit's cores runs one after another), then the number of idle cores; ties go to more
+    cores per fit. With fewer runs than the budget allows, the spare cores go to the runs.
+    Returns n_workers, cores_per_fit.
+    """
+    if total_cores < 1:
+        raise ValueError(f"total_cores must be at least 1, got {total_cores}.")
+    best = None
+    for cores_per_fit in range(1, min(chains, total_cores) + 1):
+        n_workers = min(total_cores // cores_per_fit, n_runs)
+        busy = n_workers * cores_per_fit
+        rounds = int(np.ceil(n_runs / n_workers)) * int(np.ceil(chains / cores_per_fit))
+        key = (rounds, total_cores - busy, -cores_per_fit)
+        if best is None or key < best[0]:
+            best = (key, n_workers, cores_per_fit)
+    return best[1], best[2]
+
+
+def fit_and_save(data, model_func=ordinal_predictor_binary_outcome_model, label="b02", output_dir="../results",
+                 **model_kwargs):
+    """
+    Fits model_func and writes the core artifacts under the usual names: idata_{label}.nc,
+    tuning_{label}.json (pymc backend) and survey_model_metrics_{label}.md.
+    Used by the sweep CLI; run_and_summarize from milestone_b03 also writes the summaries and plots.
+    Returns idata, waic, loo, bic.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    model, idata, waic, loo, bic = model_func(data["predictor"], data["outcome"], **model_kwargs)
+    idata.to_netcdf(os.path.join(output_dir, f"idata_{label}.nc"))
+    if "sample_stats" in idata and "tuning" in idata.sample_stats.attrs:
+        save_tuning(json.loads(idata.sample_stats.attrs["tuning"]), os.path.join(output_dir, f"tuning_{label}.json"))
+    save_model_metrics(label, waic, loo, bic, os.path.join(output_dir, f"survey_model_metrics_{label}.md"))
+    return idata, waic, loo, bic
+
+
+def _limit_threads():
+    """
+    Pool initializer: one BLAS/OpenMP thread per process, so the core budget is not exceeded.
+    The thread pools of the libraries already loaded (numpy's BLAS, inherited by forked workers)
+    are capped with threadpoolctl; the environment variables cover libraries loaded later and the
+    chain processes PyMC starts from the worker.
+    """
+    threadpool_limits(limits=1)
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = "1"
+
+
+def _run_one(run_func, data, model_func, label, output_dir, cores, model_kwargs):
+    """Runs one fit of the sweep in a worker process and returns its row of the index."""
+    row = {"label": label, **model_kwargs, "cores": cores}
+    start = time.perf_counter()
+    try:
+        idata, waic, loo, bic = run_func(data, model_func, label=label, output_dir=output_dir, cores=cores,
+                                         **model_kwargs)[:4]
+        row.update(status="ok", error="", elpd_waic=waic.elpd_waic, elpd_loo=loo.elpd_loo, bic=bic,
+                   idata_path=os.path.join(output_dir, f"idata_{label}.nc"))
+    except Exception as e:
+        row.update(status="failed", error=repr(e))
+    row["seconds"] = time.perf_counter() - start
+    return row
+
+
+def run_sweep(data, grid, run_func=fit_and_save, model_func=ordinal_predictor_binary_outcome_model,
+              total_cores=None, output_dir="../results", prefix="sweep"):
+    """
+    Runs one fit per model_kwargs of the grid (see expand_grid) on a process pool.
+    The fits share total_cores (default: all CPUs) as planned by plan_cores, each fit getting
+    `cores` for its chains, so the machine is neither oversubscribed nor left idle.
+    run_func(data, model_func, label=..., output_dir=..., cores=..., **model_kwargs) writes the
+    run's label-tagged artifacts; pass run_and_summarize for the full set of summaries and plots
+    (it must be importable by the worker processes, or defined in __main__ on a fork-based platform).
+    The grid must not set "cores": it is planned from total_cores for every run.
+    A failed run is recorded in the index and does not stop the sweep.
+    The combined index of the runs is written to {prefix}_index.csv in output_dir.
+    Returns the index as a pandas DataFrame.
+    """
+    runs = expand_grid(grid)
+    if any("cores" in model_kwargs for model_kwargs in runs):
+        raise ValueError("The sweep grid must not set 'cores': each fit's cores are planned from total_cores.")
+    total_cores = total_cores or os.cpu_count()
+    chains = max(model_kwargs.get("chains", 4) for model_kwargs in runs) if runs else 4
+    n_workers, cores_per_fit = plan_cores(len(runs), total_cores, chains)
+    data = {"predictor": np.asarray(data["predictor"]), "outcome": np.asarray(data["outcome"])}
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"ℹ️ Sweep of {len(runs)} runs: {n_workers} at a time with {cores_per_fit} cores each "
+          f"(budget {total_cores} cores).")
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_limit_threads) as pool:
+        futures = [
+            pool.submit(_run_one, run_func, data, model_func, run_label(model_kwargs, prefix), output_dir,
+                        cores_per_fit, model_kwargs)
+            for model_kwargs in runs
+        ]
+        for future in as_completed(futures):
+            row = future.result()
+            print(f"{'✅' if row['status'] == 'ok' else '❌'} {row['label']} ({row['seconds']:.0f} s)")
+            rows.append(row)
+
+    order = {run_label(model_kwargs, prefix): i for i, model_kwargs in enumerate(runs)}
+    index = pd.DataFrame(rows).sort_values("label", key=lambda labels: labels.map(order)).reset_index(drop=True)
+    index.to_csv(os.path.join(output_dir, f"{prefix}_index.csv"), index=False)
+    return index
+
+
+def _load_runner(spec):
+    """Imports a "module:function" runner given on the command line."""
+    module_name, function_name = spec.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a sweep of B01/B02 fits on a process pool.")
+    parser.add_argument("data", help="CSV file with 'predictor' and 'outcome' columns.")
+    parser.add_argument("grid", help="JSON file with a dict of lists or a list of model_kwargs dicts.")
+    parser.add_argument("--total-cores", type=int, default=None, help="Core budget (default: all CPUs).")
+    parser.add_argument("--output-dir", default="../results")
+    parser.add_argument("--prefix", default="sweep", help="Prefix of the run labels and the index file.")
+    parser.add_argument("--runner", default="sweep_b02:fit_and_save",
+                        help="module:function writing the artifacts of one run.")
+    args = parser.parse_args(argv)
+
+    data = pd.read_csv(args.data)
+    with open(args.grid) as f:
+        grid = json.load(f)
+    index = run_sweep(data, grid, run_func=_load_runner(args.runner), total_cores=args.total_cores,
+                      output_dir=args.output_dir, prefix=args.prefix)
+    print(index.to_string())
+
+
+if __name__ == "__main__":
+    main()
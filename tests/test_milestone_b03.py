@@ -0,0 +1,62 @@
+import ast
+import os
+
+import arviz as az
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+MILESTONE_B03 = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "milestone_b03.py")
+
+
+def _notebook_functions(path, names):
+    """
+    Loads the named top-level functions of a notebook export. The export starts with %run magics,
+    so it cannot be imported; the functions run with the globals the notebook gets from model_B02.
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse("\n".join(line for line in f.read().splitlines() if not line.startswith("%")))
+    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name in names]
+    namespace = {"np": np, "pd": pd, "az": az, "xr": xr}
+    exec(compile(ast.Module(body=functions, type_ignores=[]), path, "exec"), namespace)
+    return [namespace[name] for name in names]
+
+
+calculate_odds_ratio, calculate_contrast_odds_ratios = _notebook_functions(
+    MILESTONE_B03, ("calculate_odds_ratio", "calculate_contrast_odds_ratios"))
+
+
+@pytest.fixture(scope="module")
+def idata():
+    """A B02-like posterior (4 chains x 500 draws) with centered level effects on 4 levels."""
+    rng = np.random.default_rng(0)
+    raw_effects = rng.normal([-0.6, -0.2, 0.2, 0.6], 0.3, size=(4, 500, 4))
+    return az.from_dict(posterior={"intercept": rng.normal(0.4, 0.2, size=(4, 500)),
+                                   "level_effects": raw_effects - raw_effects.mean(axis=-1, keepdims=True),
+                                   "effect": rng.normal(0.3, 0.1, size=(4, 500))})
+
+
+def test_contrasts_match_looped_odds_ratios(idata):
+    result = calculate_contrast_odds_ratios(idata)
+    level_effects = idata.posterior["level_effects"].values
+    expected = {f"level_effects[{k}] vs mean level": level_effects[..., k] for k in range(4)}
+    expected.update({f"level_effects[{j}] vs level_effects[{i}]": level_effects[..., j] - level_effects[..., i]
+                     for i in range(4) for j in range(i + 1, 4)})
+    expected["effect"] = idata.posterior["effect"].values
+    assert result.index.tolist() == list(expected)
+
+    for name, log_or in expected.items():
+        looped = calculate_odds_ratio(az.from_dict(posterior={"effect": log_or}))
+        np.testing.assert_allclose(result.loc[name, ["mean", "hdi_lower", "hdi_upper"]].to_numpy(dtype=float),
+                                   looped.loc[0, ["mean", "hdi_lower", "hdi_upper"]].to_numpy(dtype=float))
+        positive = (log_or > 0).mean()
+        np.testing.assert_allclose(result.loc[name, "prob_direction"], max(positive, 1 - positive))
+
+
+def test_level_contrast_is_against_the_mean_level(idata):
+    result = calculate_contrast_odds_ratios(idata)
+    log_odds = idata.posterior["intercept"].values[..., None] + idata.posterior["level_effects"].values
+    odds_ratio = np.exp(log_odds - log_odds.mean(axis=-1, keepdims=True)).mean(axis=(0, 1))
+    np.testing.assert_allclose(result.loc[[f"level_effects[{k}] vs mean level" for k in range(4)], "mean"],
+                               odds_ratio)
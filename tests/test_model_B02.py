@@ -0,0 +1,136 @@
+import json
+
+import arviz as az
+import numpy as np
+import pytest
+import xarray as xr
+
+from model_B02 import (compare_approximation, grouped_log_likelihood, ordinal_predictor_binary_outcome_model,
+                       posterior_p, weighted_loo, weighted_waic)
+
+
+@pytest.fixture(scope="module")
+def fit():
+    """A synthetic B02-like posterior (4 chains x 400 draws) with 60 observations on 4 levels."""
+    rng = np.random.default_rng(0)
+    n_obs = 60
+    predictor = rng.integers(1, 5, size=n_obs)
+    outcome = (rng.random(n_obs) < 0.3 + 0.1 * predictor).astype(int)
+    posterior = {
+        "intercept": rng.normal(0.4, 0.2, size=(4, 400)),
+        "level_effects": rng.normal([-0.6, -0.2, 0.2, 0.6], 0.3, size=(4, 400, 4)),
+        "sd_fluctuation": rng.gamma(2, 0.2, size=(4, 400)),
+    }
+    idata = az.from_dict(posterior=posterior, constant_data={"predictor": predictor},
+                         coords={"obs": np.arange(n_obs)}, dims={"predictor": ["obs"]})
+    return idata, predictor, outcome
+
+
+def _pointwise(idata, outcome):
+    p = posterior_p(idata)
+    observed = xr.DataArray(outcome, dims="obs", coords={"obs": p["obs"]})
+    log_lik = xr.where(observed == 1, np.log(p), np.log1p(-p)).transpose("chain", "draw", "obs")
+    pointwise = idata.copy()
+    pointwise.add_groups(log_likelihood=xr.Dataset({"y_obs": log_lik}))
+    return pointwise
+
+
+def _grouped(idata, predictor, outcome):
+    grouped = idata.copy()
+    grouped.constant_data = idata.constant_data.copy()
+    return grouped_log_likelihood(grouped, predictor, outcome)
+
+
+def test_weighted_waic_matches_arviz(fit):
+    idata, predictor, outcome = fit
+    expected = az.waic(_pointwise(idata, outcome), pointwise=True)
+    result = weighted_waic(_grouped(idata, predictor, outcome))
+    for key in ("elpd_waic", "se", "p_waic", "n_samples", "n_data_points"):
+        np.testing.assert_allclose(result[key], expected[key], rtol=1e-10)
+    np.testing.assert_allclose(result["waic_i"].values, expected["waic_i"].values, rtol=1e-10)
+
+
+def test_weighted_loo_matches_arviz(fit):
+    idata, predictor, outcome = fit
+    expected = az.loo(_pointwise(idata, outcome), pointwise=True)
+    result = weighted_loo(_grouped(idata, predictor, outcome))
+    for key in ("elpd_loo", "se", "p_loo", "n_samples", "n_data_points", "good_k"):
+        np.testing.assert_allclose(result[key], expected[key], rtol=1e-10)
+    np.testing.assert_allclose(result["loo_i"].values, expected["loo_i"].values, rtol=1e-10)
+    np.testing.assert_allclose(result["pareto_k"].values, expected["pareto_k"].values, rtol=1e-10)
+
+
+# Short fits of the binomial model on 333 simulated respondents. The chains run in worker processes,
+# so the cached step in this process keeps its initial mass matrix while the adapted one is used.
+FIT_KWARGS = dict(shape=3, likelihood="binomial", predictive="numpy", chains=2, cores=2)
+CHECKED_VARS = ("level_effects", "sd_fluctuation", "effect")
+
+
+@pytest.fixture(scope="module")
+def survey():
+    rng = np.random.default_rng(0)
+    predictor = rng.integers(1, 5, size=333)
+    outcome = (rng.random(333) < 1 / (1 + np.exp(-(predictor - 2.5) * 0.5))).astype(int)
+    return predictor, outcome
+
+
+@pytest.fixture(scope="module")
+def cold_fit(survey):
+    _, idata, waic, _, _ = ordinal_predictor_binary_outcome_model(*survey, draws=500, tune=1000, **FIT_KWARGS)
+    return idata, waic
+
+
+def assert_same_posterior(idata, reference, waic, reference_waic):
+    """
+    WAIC within 2 of the reference and posterior means within 1.5 posterior sd. A short run of
+    the centered form has a few divergences, so its MCSE understates the error of the means;
+    a sampler using the wrong mass matrix is off by 10 or more in WAIC.
+    """
+    for var in CHECKED_VARS:
+        mean = idata.posterior[var].mean(("chain", "draw")).values
+        reference_mean = reference.posterior[var].mean(("chain", "draw")).values
+        sd = reference.posterior[var].std(("chain", "draw")).values
+        np.testing.assert_array_less(np.abs(mean - reference_mean), 1.5 * sd)
+    assert abs(waic.elpd_waic - reference_waic.elpd_waic) < 2
+
+
+@pytest.mark.parametrize("tune", [0, 50])
+def test_warm_started_fit_matches_cold_fit(survey, cold_fit, tune):
+    reference, reference_waic = cold_fit
+    tuning = json.loads(reference.sample_stats.attrs["tuning"])
+    _, idata, waic, _, _ = ordinal_predictor_binary_outcome_model(*survey, draws=500, tune=tune, seed=7,
+                                                                  init_tuning=tuning, **FIT_KWARGS)
+    assert_same_posterior(idata, reference, waic, reference_waic)
+
+
+def test_block_continued_draws_match_one_run(survey, cold_fit):
+    reference, reference_waic = cold_fit
+    _, idata, waic, _, _ = ordinal_predictor_binary_outcome_model(
+        *survey, draws=500, tune=1000, seed=7, stopping="ess", block_draws=100,
+        stopping_targets={"ess_bulk": np.inf}, **FIT_KWARGS)
+    assert idata.posterior.sizes["draw"] == 500
+    assert_same_posterior(idata, reference, waic, reference_waic)
+
+
+@pytest.mark.parametrize("model_kwargs", [{}, {"likelihood": "bernoulli", "p_storage": "level"}])
+def test_vi_fit_runs_end_to_end(survey, cold_fit, model_kwargs):
+    reference, _ = cold_fit
+    kwargs = {**FIT_KWARGS, **model_kwargs}
+    _, idata, waic, loo, bic = ordinal_predictor_binary_outcome_model(
+        *survey, inference="vi", vi_iterations=5000, draws=500, **kwargs)
+    assert idata.posterior.attrs["inference"] == "advi"
+    assert idata.posterior.sizes["chain"] == 1
+    assert np.isfinite([waic.elpd_waic, loo.elpd_loo, bic]).all()
+    comparison = compare_approximation(idata, reference, var_names=list(CHECKED_VARS))
+    assert comparison.index.tolist() == az.summary(reference, var_names=list(CHECKED_VARS)).index.tolist()
+    assert np.isfinite(comparison.to_numpy(dtype=float)).all()
+
+
+def test_binomial_defaults_store_nothing_per_respondent(survey, cold_fit):
+    reference, reference_waic = cold_fit
+    assert "p_level" in reference.posterior and "p" not in reference.posterior
+    assert "obs" not in reference.posterior.dims and "obs" not in reference.log_likelihood.dims
+    _, idata, waic, _, _ = ordinal_predictor_binary_outcome_model(
+        *survey, draws=500, tune=1000, p_storage="obs", loglik="pointwise", **FIT_KWARGS)
+    assert idata.log_likelihood.sizes["obs"] == len(survey[1])
+    np.testing.assert_allclose(waic.elpd_waic, reference_waic.elpd_waic, rtol=1e-8)
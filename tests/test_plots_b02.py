@@ -0,0 +1,46 @@
+import os
+
+import arviz as az
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from plots_b02 import plot_trace_downsampled, render_plots
+
+
+def test_in_process_rendering_keeps_the_backend(tmp_path):
+    rng = np.random.default_rng(0)
+    idata = az.from_dict(posterior={"effect": rng.normal(size=(2, 50)), "sd_fluctuation": rng.gamma(2, size=(2, 50))})
+    idata_path = str(tmp_path / "idata_test.nc")
+    idata.to_netcdf(idata_path)
+
+    previous = matplotlib.get_backend()
+    matplotlib.use("pdf", force=True)
+    try:
+        written = render_plots(idata_path, "test", str(tmp_path), plots=("trace", "rank"),
+                               var_names=["effect", "sd_fluctuation"], dpi=50, max_workers=1)
+        assert matplotlib.get_backend() == "pdf"
+    finally:
+        matplotlib.use(previous, force=True)
+    assert set(written) == {"trace", "rank"}
+    assert all(os.path.exists(path) for path in written.values())
+
+
+@pytest.mark.parametrize("n_draws", [300, 5000])
+def test_downsampled_trace_panels_have_data(n_draws):
+    rng = np.random.default_rng(0)
+    idata = az.from_dict(posterior={"effect": rng.normal(size=(2, n_draws)),
+                                    "level_effects": rng.normal(size=(2, n_draws, 3))})
+    axes = plot_trace_downsampled(idata, ["effect", "level_effects"], n_columns=1800)
+    try:
+        for trace_ax in axes[:, 1]:
+            lines = [line for line in trace_ax.get_lines() if len(line.get_xdata())]
+            bands = [band for band in trace_ax.collections
+                     if len(band.get_paths()) and (band.get_linewidth() > 0).all()]
+            assert lines or bands
+            if n_draws <= 1800:
+                # every chain of every element is drawn with all its draws
+                assert all(len(line.get_xdata()) == n_draws for line in lines)
+    finally:
+        plt.close("all")
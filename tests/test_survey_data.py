@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+import pytest
+
+from survey_data import (MISSING_CODE, SurveyStatsStore, encode_likert, ingest_survey_stream, likert_medians,
+                         load_survey_data, quantiles_from_counts)
+
+MAPPING = {"Egyáltalán nem": 1, "Kicsit": 2, "Közepesen": 3, "Nagyon": 4, "Teljes mértékben": 5}
+
+
+def test_encode_likert_matches_map():
+    data = pd.DataFrame({
+        "C034": ["Kicsit", None, "Nagyon", "Nem tudom"],
+        "C035": ["Teljes mértékben", "Kicsit", np.nan, "Egyáltalán nem"],
+    }, index=[10, 11, 12, 13])
+    codes = encode_likert(data, ["C034", "C035"], MAPPING)
+    assert (codes.dtypes == np.int8).all()
+    assert codes.index.equals(data.index)
+    for col in ["C034", "C035"]:
+        expected = data[col].map(MAPPING).fillna(MISSING_CODE).astype(np.int8)
+        pd.testing.assert_series_equal(codes[col], expected)
+
+
+def _random_codes(seed=0, n=101):
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(1, 6, size=(n, 3)).astype(np.int8)
+    codes[rng.random(codes.shape) < 0.2] = MISSING_CODE
+    return pd.DataFrame(codes, columns=["C034", "C035", "C036"])
+
+
+def test_likert_medians_match_pandas():
+    codes = _random_codes()
+    codes["C036"] = MISSING_CODE
+    expected = codes.replace(MISSING_CODE, np.nan).median()
+    pd.testing.assert_series_equal(likert_medians(codes), expected, check_dtype=False)
+
+
+def test_store_replaces_only_the_items_of_a_wave(tmp_path):
+    store = SurveyStatsStore(tmp_path)
+    codes = _random_codes()
+    store.add_wave("w1", codes[["C034", "C035"]])
+    store.add_wave("w1", codes[["C036"]])
+    medians = quantiles_from_counts(store.item_counts(["C034", "C035", "C036"]))
+    pd.testing.assert_series_equal(medians, likert_medians(codes), check_names=False)
+
+    # adding the wave again replaces its counts instead of adding to them
+    store.add_wave("w1", _random_codes(seed=1)[["C034"]])
+    counts = store.item_counts(["C034"])
+    assert counts.to_numpy().sum() == (_random_codes(seed=1)["C034"] != MISSING_CODE).sum()
+
+
+@pytest.mark.parametrize("extension", ["xlsx", "csv"])
+def test_streamed_ingestion_matches_in_memory(tmp_path, extension):
+    rng = np.random.default_rng(2)
+    answers = np.array(list(MAPPING) + ["Nem tudom", None], dtype=object)
+    sheet = pd.DataFrame({f"Question {i}": rng.choice(answers, size=23) for i in range(37)})
+    sheet["Question 4"] = rng.choice(["Igen", "Nem"], size=23)
+    file = str(tmp_path / f"survey.{extension}")
+    if extension == "csv":
+        sheet.to_csv(file, index=False)
+    else:
+        sheet.to_excel(file, sheet_name="Data", index=False)
+    likert_columns = ["C034", "C035", "C036"]
+    outcome = {"outcome_binary": ("C004", lambda answers: (answers == "Igen").astype(int))}
+
+    store = SurveyStatsStore(tmp_path / "stats")
+    n_rows = ingest_survey_stream(file, store, "streamed", likert_columns, MAPPING, outcomes=outcome, chunksize=5)
+    if extension == "csv":
+        data = pd.read_csv(file).rename(columns=lambda name: f"C{int(name.split()[1]):03d}")
+    else:
+        data = load_survey_data(file, columns=likert_columns + ["C004"], cache_dir=tmp_path / "cache")
+    codes = encode_likert(data, likert_columns, MAPPING)
+    store.add_wave("in_memory", codes, outcomes={"outcome_binary": (data["C004"] == "Igen").astype(int)})
+
+    assert n_rows == len(data) == 23
+    streamed = store.item_counts(likert_columns, waves=["streamed"])
+    in_memory = store.item_counts(likert_columns, waves=["in_memory"])
+    pd.testing.assert_frame_equal(streamed, in_memory)
+    pd.testing.assert_series_equal(quantiles_from_counts(streamed), likert_medians(codes), check_names=False)
+    for c_id in likert_columns:
+        pd.testing.assert_frame_equal(store.contingency_table(c_id, "outcome_binary", waves=["streamed"]),
+                                      store.contingency_table(c_id, "outcome_binary", waves=["in_memory"]))
@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from sweep_b02 import plan_cores, run_sweep
+
+
+def _fake_run(data, model_func, label, output_dir, cores, seed=0, **model_kwargs):
+    if seed == 2:
+        raise RuntimeError("diverged")
+    return None, SimpleNamespace(elpd_waic=-seed), SimpleNamespace(elpd_loo=-seed), float(cores)
+
+
+@pytest.mark.parametrize("n_runs", [1, 3, 8])
+@pytest.mark.parametrize("total_cores", [1, 4, 6, 16])
+def test_plan_cores_stays_within_budget(n_runs, total_cores):
+    n_workers, cores_per_fit = plan_cores(n_runs, total_cores, chains=4)
+    assert 1 <= n_workers <= n_runs
+    assert 1 <= cores_per_fit <= 4
+    assert n_workers * cores_per_fit <= total_cores
+
+
+def test_run_sweep_records_every_run(tmp_path):
+    data = {"predictor": np.array([1, 2, 3]), "outcome": np.array([0, 1, 1])}
+    index = run_sweep(data, {"seed": [1, 2, 3]}, run_func=_fake_run, total_cores=2, output_dir=str(tmp_path))
+    assert index["seed"].tolist() == [1, 2, 3]
+    assert index["status"].tolist() == ["ok", "failed", "ok"]
+    assert (tmp_path / "sweep_index.csv").exists()
+
+
+def test_run_sweep_rejects_cores_in_grid(tmp_path):
+    with pytest.raises(ValueError, match="cores"):
+        run_sweep({"predictor": [1], "outcome": [0]}, {"cores": [2]}, run_func=_fake_run, output_dir=str(tmp_path))
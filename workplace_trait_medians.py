@@ -1,15 +1,8 @@
 if 1: # Import Libraries
     import pandas as pd
     import numpy as np
-if 1: # Import data
-    file = "2023-11-14-survey-data-a-szervezeti-kommunikacio-jelentosege-a-munkaero-megtartasaban(1).xlsx"
-    data = pd.read_excel(file, sheet_name="Data")
-    data.head()
-    data.info()
-if 1: # Rename columns to C999 format
-    new_columns = {old_col: f'C{i:03d}' for i, old_col in enumerate(data.columns)}
-    data = data.rename(columns=new_columns)
-    data.head()
+    from survey_data import load_survey_data, encode_likert, quantiles_from_counts, format_likert_median
+    from survey_data import SurveyStatsStore, SURVEY_STATS_DIR, ingest_survey_stream
 PASTEX_COLUMN_NAMES = [
     "C026", # At my previous organization, all the necessary communication tools were fully available.
     "C028", # At my previous workplace, my employer ensured that the necessary information reached me in a timely manner.
@@ -33,6 +26,14 @@ PRESENTEX_COLUMN_NAMES = [
     "C094", # Management enables informal communication and casual conversations. These are part of our organization’s everyday life.
     "C096", # At my workplace, the style of communication is honest and respectful.
 ]
+if 1: # Import data (Parquet cache of the Excel sheet, C999 column IDs already applied)
+    file = "2023-11-14-survey-data-a-szervezeti-kommunikacio-jelentosege-a-munkaero-megtartasaban(1).xlsx"
+    SURVEY_WAVE = "2023-11-14"
+    STREAM_INGEST = False # True for exports larger than memory: encoded chunk by chunk into the stats store
+    if not STREAM_INGEST:
+        data = load_survey_data(file, sheet_name="Data", columns=PASTEX_COLUMN_NAMES + PRESENTEX_COLUMN_NAMES)
+        data.head()
+        data.info()
 QUESTIONS_ENGLISH_TRANSLATIONS_PASTEX = [
     "At my previous organization, all the necessary communication tools were fully available.",
     "At my previous workplace, my employer ensured that the necessary information reached me in a timely manner.",
@@ -56,7 +57,7 @@ QUESTIONS_ENGLISH_TRANSLATIONS_PRESENTEX = [
     "Management enables informal communication and casual conversations. These are part of our organization’s everyday life.",
     "At my workplace, the style of communication is honest and respectful.",
 ]
-if 1: # Data check: Find the unique values of each PastEx and PresentEx Variable observed
+if not STREAM_INGEST: # Data check: Find the unique values of each PastEx and PresentEx Variable observed
     print("--- Unique Values for Workplace Trait Variables ---")
     all_workplace_trait_columns = PASTEX_COLUMN_NAMES + PRESENTEX_COLUMN_NAMES
     for col_id in all_workplace_trait_columns:
@@ -68,6 +69,17 @@ if 1: # Data check: Find the unique values of each PastEx and PresentEx Variable
             print(f"\nWarning: Column ID '{col_id}' not found in the DataFrame after renaming.")
 if 1: # For each survey question convert answers to numbers, calculate medians
     from likert_mapping import LIKERT_MAPPING # Hungarian to code mapping
+    stats_store = SurveyStatsStore(SURVEY_STATS_DIR) # per-wave Likert histograms, shared with milestone_b03
+    # this wave's items are rebuilt on every run, so a re-exported file or a new mapping is picked up
+    if STREAM_INGEST:
+        trait_columns = PASTEX_COLUMN_NAMES + PRESENTEX_COLUMN_NAMES
+        ingest_survey_stream(file, stats_store, SURVEY_WAVE, trait_columns, LIKERT_MAPPING)
+    else:
+        trait_columns = [col_id for col_id in PASTEX_COLUMN_NAMES + PRESENTEX_COLUMN_NAMES if col_id in data.columns]
+        likert_codes = encode_likert(data, trait_columns, LIKERT_MAPPING) # respondents x items, int8
+        stats_store.add_wave(SURVEY_WAVE, likert_codes)
+    # all items at once, from the answer histograms summed over the stored waves
+    medians = quantiles_from_counts(stats_store.item_counts(trait_columns))
     medians_data = [] # Prepare a list to store dictionaries with calculated medians and question info
     max_len = max(len(PASTEX_COLUMN_NAMES), len(PRESENTEX_COLUMN_NAMES)) # Interleave PastEx and PresentEx questions for output  
     for i in range(max_len):
@@ -76,10 +88,8 @@ if 1: # For each survey question convert answers to numbers, calculate medians
             col_id_past = PASTEX_COLUMN_NAMES[i]
             question_past = QUESTIONS_ENGLISH_TRANSLATIONS_PASTEX[i]
             median_past = np.nan
-            if col_id_past in data.columns:
-                numeric_data_past = data[col_id_past].map(LIKERT_MAPPING).dropna()
-                if not numeric_data_past.empty:
-                    median_past = numeric_data_past.median()
+            if col_id_past in trait_columns:
+                median_past = medians[col_id_past]
             else:
                 print(f"Warning: PastEx Column ID '{col_id_past}' not found. Skipping.")
             medians_data.append({"Group": "PastEx", "Question": question_past, "Median": median_past})
@@ -87,10 +97,8 @@ if 1: # For each survey question convert answers to numbers, calculate medians
             col_id_present = PRESENTEX_COLUMN_NAMES[i]
             question_present = QUESTIONS_ENGLISH_TRANSLATIONS_PRESENTEX[i]
             median_present = np.nan
-            if col_id_present in data.columns:
-                numeric_data_present = data[col_id_present].map(LIKERT_MAPPING).dropna()
-                if not numeric_data_present.empty:
-                    median_present = numeric_data_present.median()
+            if col_id_present in trait_columns:
+                median_present = medians[col_id_present]
             else:
                 print(f"Warning: PresentEx Column ID '{col_id_present}' not found. Skipping.")
             medians_data.append({"Group": "PresentEx", "Question": question_present, "Median": median_present})
@@ -104,15 +112,6 @@ if 1: # Generate the B06 Deliverable 1 (D1) table (finding text form of medians)
         for item in medians_data:
             q_group = item["Group"]
             q_text = item["Question"]
-            m = item["Median"]
-
-            if pd.isna(m):
-                formatted_median = "N/A"
-            elif float(m).is_integer():
-                formatted_median = LIKERT_ENGLISH[int(m)]
-            else:
-                lower = int(np.floor(m))
-                upper = int(np.ceil(m))
-                formatted_median = f'Between "{LIKERT_ENGLISH[lower]}" and "{LIKERT_ENGLISH[upper]}"'
+            formatted_median = format_likert_median(item["Median"], LIKERT_ENGLISH)
             f.write(f'| {q_group} | {q_text} | {formatted_median} |\n')
 print(f"✅ Markdown file saved to {output_md_path}")
\ No newline at end of file